@@ -0,0 +1,4 @@
+import time
+
+# time.perf_counter time at which mreye was first imported, see mreye.startup
+IMPORT_START = time.perf_counter()
@@ -0,0 +1,53 @@
+class Backend:
+    """Source of analog samples and sink for reward pulses used by `Interface`.
+
+    A backend is opened once by `Interface.start`, then `read` is called
+    repeatedly from the acquisition thread to fill consecutive chunks. The
+    reward output is prepared once with `prepare_reward`, also by
+    `Interface.start`, and then played with `reward` from the reward thread.
+    Subclasses must implement `open`, `read`, `prepare_reward` and `reward`.
+
+    A paced backend's `read` blocks until the hardware has acquired the chunk.
+    Reads from a backend that is not paced return immediately, so the
+    interface waits for the consumer to make room before each read instead.
+    """
+    paced = True
+
+    def open(self, interface):
+        """Prepare acquisition for `interface` and start the sample clock.
+
+        Returns
+        -------
+        scales: list of list of float or None
+            Per channel polynomial coefficients mapping the values returned in
+            raw mode to volts, or None if raw mode is not in use
+        """
+        raise NotImplementedError
+
+    def read(self, out):
+        """Block until the next chunk is available and write it into `out`.
+
+        `out` is shaped (channels, samples) and is float64 volts, or int16
+        counts when the interface records raw data.
+        """
+        raise NotImplementedError
+
+    def prepare_reward(self, interface, trace):
+        """Set up the reward output for `interface` with the waveform `trace`."""
+        raise NotImplementedError
+
+    def reward(self):
+        """Play the prepared reward waveform, blocking until it is done.
+
+        Returns
+        -------
+        started: float
+            `time.perf_counter` time at which the output started
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def close_reward(self):
+        pass
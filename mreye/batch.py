@@ -0,0 +1,167 @@
+from mreye.getLogger import getLogger
+from mreye.gaze import GazeProcessor
+from mreye.main import Experiment, fixated_samples
+from mreye.session import Session
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import csv
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+CACHE_VERSION = 4
+COLUMNS = [
+    'session', 'block', 'name', 'start', 'stop', 'n_triggers', 'rewards',
+    'fixation_proportion', 'tr_interval_mean', 'tr_interval_std',
+]
+
+def find_sessions(root):
+    """Session directories below `root`, recognised by their sequence.json and analog data."""
+    return sorted(
+        path.parent for path in Path(root).rglob('sequence.json')
+        if (path.parent/'analog_data.bin').exists()
+    )
+
+def session_key(path):
+    """Cache key that changes whenever any input file of the session changes.
+
+    The analog data is keyed by size and mtime, the small text files by hash.
+    """
+    path = Path(path)
+    analog = os.stat(path/'analog_data.bin')
+    key = {'version': CACHE_VERSION, 'analog': [analog.st_size, analog.st_mtime_ns]}
+    for name in ('events.jsonl', 'data.txt', 'sequence.json', 'calibration.json'):
+        try:
+            with open(path/name, 'rb') as f:
+                key[name] = hashlib.sha1(f.read()).hexdigest()
+        except FileNotFoundError:
+            key[name] = None
+    return key
+
+def fixation_proportion(session, block, fixation, calibration=None):
+    """Proportion of samples of `block` within the fixation window, counted as `Experiment` does."""
+    if calibration is None:
+        calibration = session.calibration or Experiment.eye_calibration
+    eye_h = session.channel(session.role_channel('eye_h'), block['start'], block['stop'])
+    eye_v = session.channel(session.role_channel('eye_v'), block['start'], block['stop'])
+    if len(eye_h) == 0:
+        return None
+    gaze = GazeProcessor(session.sampling_rate, calibration).process(eye_h, eye_v)
+    fixated, valid = fixated_samples(gaze, fixation)
+    return fixated / valid if valid else None
+
+def analyze_session(path):
+    """Per block summary rows for the session at `path`."""
+    session = Session(path)
+    # events belong to the block started last before them; the TR that ends a
+    # block shares its sample with the next block's start but is logged first
+    block_of = np.cumsum([event.name == 'BLOCK_START' for event in session.events]) - 1
+    events = {name: [i for i, event in enumerate(session.events) if event.name == name] for name in ('TR_LOW', 'REWARD')}
+    trs = session.event_samples([session.events[i] for i in events['TR_LOW']])
+    tr_blocks = block_of[events['TR_LOW']]
+    reward_blocks = block_of[events['REWARD']]
+    rows = []
+    for i, block in enumerate(session.blocks):
+        definition = session.sequence[block['index']] if block['index'] < len(session.sequence) else {}
+        in_block = tr_blocks == i
+        intervals = np.diff(trs[in_block]) / session.sampling_rate
+        fixation = definition.get('fixation')
+        rows.append({
+            'session': str(session.path),
+            'block': block['index'],
+            'name': block['name'],
+            'start': block['start'],
+            'stop': block['stop'],
+            'n_triggers': int(in_block.sum()),
+            'rewards': int((reward_blocks == i).sum()),
+            'fixation_proportion': fixation_proportion(session, block, fixation) if fixation else None,
+            'tr_interval_mean': float(intervals.mean()) if len(intervals) else None,
+            'tr_interval_std': float(intervals.std()) if len(intervals) else None,
+        })
+    return rows
+
+def cache_path(cache_dir, path):
+    return Path(cache_dir)/(hashlib.sha1(str(Path(path).resolve()).encode('utf-8')).hexdigest() + '.json')
+
+def load_cached(cache_dir, path, key):
+    try:
+        with open(cache_path(cache_dir, path)) as f:
+            cached = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if cached['key'] != key:
+        return None
+    return cached['rows']
+
+def analyze_sessions(root, cache_dir=None, max_workers=None, logger=None):
+    """Analyze every session below `root` in parallel, skipping unchanged sessions.
+
+    Parameters
+    ----------
+    root: str or Path
+        Directory searched for sessions
+    cache_dir: str or Path, optional
+        Where per session results are cached, defaults to `root/.mreye_cache`
+    max_workers: int, optional
+        Number of worker processes
+    logger: logging.Logger, optional
+
+    Returns
+    -------
+    rows: list of dict
+        One row per block of every session, with keys COLUMNS
+    """
+    if logger is None:
+        logger = getLogger('batch')
+    if cache_dir is None:
+        cache_dir = Path(root)/'.mreye_cache'
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+
+    results = {}
+    todo = {}
+    for path in find_sessions(root):
+        key = session_key(path)
+        rows = load_cached(cache_dir, path, key)
+        if rows is None:
+            todo[path] = key
+        else:
+            results[path] = rows
+    logger.info("{} sessions cached, {} to analyze".format(len(results), len(todo)))
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(analyze_session, path): path for path in todo}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    logger.error("Failed to analyze {}: {}".format(path, e))
+                    continue
+                results[path] = rows
+                with open(cache_path(cache_dir, path), 'w') as f:
+                    json.dump({'key': todo[path], 'rows': rows}, f)
+
+    return [row for path in sorted(results) for row in results[path]]
+
+def write_table(rows, f):
+    writer = csv.DictWriter(f, fieldnames=COLUMNS)
+    writer.writeheader()
+    writer.writerows(rows)
+
+if __name__ == "__main__":
+    import sys
+
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    options = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    workers = int(options['workers']) if 'workers' in options else None
+
+    rows = analyze_sessions(args[0], cache_dir=options.get('cache'), max_workers=workers)
+    if len(args) > 1:
+        with open(args[1], 'w', newline='') as f:
+            write_table(rows, f)
+    else:
+        write_table(rows, sys.stdout)
@@ -0,0 +1,209 @@
+from mreye.display import Display
+from mreye.getLogger import stop_logging
+from mreye.channels import DEFAULT_CHANNELS
+from mreye.main import Experiment
+from mreye.render_backend import OffscreenBackend
+from mreye.simulation import SimulatedBackend
+
+import json
+import platform
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+PERCENTILES = (50, 90, 99)
+
+def summarize(latencies):
+    """Percentiles of `latencies` in seconds, reported in milliseconds."""
+    latencies = np.asarray(latencies) * 1e3
+    if len(latencies) == 0:
+        return {'n': 0}
+    summary = {'n': len(latencies)}
+    for p in PERCENTILES:
+        summary['p{}_ms'.format(p)] = float(np.percentile(latencies, p))
+    summary['max_ms'] = float(latencies.max())
+    return summary
+
+class BenchmarkBackend(SimulatedBackend):
+    """Simulated backend that records when each reward starts."""
+    def prepare_reward(self, interface, trace):
+        super().prepare_reward(interface, trace)
+        self.reward_times = []
+
+    def reward(self):
+        started = super().reward()
+        self.reward_times.append(started)
+        return started
+
+    def sample_time(self, sample):
+        """`time.perf_counter` time at which `sample` was acquired."""
+        return self.start_time + sample / self.sampling_rate / self.speed
+
+class HeadlessDisplay(Display):
+    """Display that renders offscreen and records when stimuli are applied and first shown."""
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('render_backend', OffscreenBackend())
+        super().__init__(*args, **kwargs)
+        self.update_times = []
+        self.first_frame_times = []
+        self.pending_first_frame = False
+
+    def process_update(self, update):
+        result = super().process_update(update)
+        if any(isinstance(item, dict) for item in update):
+            self.update_times.append(time.perf_counter())
+            self.pending_first_frame = True
+        return result
+
+    def present(self, frame):
+        super().present(frame)
+        if self.pending_first_frame:
+            self.first_frame_times.append(time.perf_counter())
+            self.pending_first_frame = False
+
+class BenchmarkExperiment(Experiment):
+    """`Experiment` with a headless display and timestamps of every trigger it handles."""
+    def __init__(self, sequence, session_name, backend, interface_args=None):
+        super().__init__(sequence, session_name, backend=backend, interface_args=interface_args)
+        self.display = HeadlessDisplay([1920,0,1920,1080], 119, 38.4, logger=self.display.logger)
+        self.trigger_times = []
+        self.lags = []
+
+    def process_chunk(self, analogdata, start_sample):
+        buffer = self.interface.buffer
+        self.lags.append(buffer.written - buffer.read_seq)
+        super().process_chunk(analogdata, start_sample)
+
+    def on_trigger(self, sample):
+        self.trigger_times.append((sample, time.perf_counter()))
+        super().on_trigger(sample)
+
+def benchmark_sequence(n_blocks, triggers_per_block):
+    return [
+        {
+            'name': 'block{}'.format(i), 'n_triggers': triggers_per_block,
+            'stimuli': [{'type': 'circle', 'x': 2 * (i % 2), 'y': 0, 'c': (255, 255, 255), 'r': 0.5, 'z': 0}],
+            'fixation': {'x': 0, 'y': 0, 'radius': 3, 'proportion': 0.5},
+        }
+        for i in range(n_blocks)
+    ]
+
+def measure_latency(root, TR=0.5, n_blocks=6, triggers_per_block=3, seed=0):
+    """Run a simulated session in real time and measure how fast triggers are acted on.
+
+    Every latency is measured from the moment the trigger edge was acquired:
+
+    - edge_detection: until `Experiment.on_trigger` runs
+    - reward_dispatch: until the reward output starts
+    - block_switch: until the display has applied the next block's stimuli
+    - first_frame: until the first frame with them has been rendered
+    """
+    backend = BenchmarkBackend(TR=TR, speed=1.0, seed=seed, blink_rate=0)
+    # the eye rests on the fixation point, so every TR is rewarded
+    backend.gaze = (0, 0)
+    experiment = BenchmarkExperiment(benchmark_sequence(n_blocks, triggers_per_block), Path(root)/'latency', backend)
+    experiment.run()
+
+    edge_samples = np.array([sample for sample, _ in experiment.trigger_times])
+    edge_times = backend.sample_time(edge_samples)
+    detected = np.array([t for _, t in experiment.trigger_times])
+    # the first trigger starts the first block; the rest are counted from there
+    rewarded = edge_times[1:][:len(backend.reward_times)]
+    block_ends = edge_times[triggers_per_block-1::triggers_per_block]
+    display = experiment.display
+    # the first block is posted before acquisition starts
+    updates = np.array(display.update_times[1:])
+    first_frames = np.array(display.first_frame_times[1:])
+    n = min(len(block_ends), len(updates), len(first_frames))
+    return {
+        'edge_detection': summarize(detected - edge_times),
+        'reward_dispatch': summarize(np.array(backend.reward_times[:len(rewarded)]) - rewarded),
+        'block_switch': summarize(updates[:n] - block_ends[:n]),
+        'first_frame': summarize(first_frames[:n] - block_ends[:n]),
+        'frame_timing': display.timer.summary(),
+    }
+
+def measure_throughput(root, sampling_rate, channels, duration=2.0, latency_budget=0.025, speed=1.0):
+    """Run acquisition and processing with `channels` channels at `sampling_rate` for `duration` seconds.
+
+    The pipeline sustains the rate if the consumer never loses chunks and
+    the number of chunks waiting for it does not grow.
+    """
+    interface_args = {
+        'channels': DEFAULT_CHANNELS + [
+            {'name': 'ai{}'.format(i), 'device': 'Dev2/ai{}'.format(i)} for i in range(len(DEFAULT_CHANNELS), channels)
+        ],
+        'sampling_rate': sampling_rate,
+        'latency_budget': latency_budget,
+    }
+    TR = duration / 2
+    backend = BenchmarkBackend(TR=TR, speed=speed, seed=0)
+    sequence = [{'name': 'throughput', 'n_triggers': 3}]
+    experiment = BenchmarkExperiment(sequence, Path(root)/'throughput_{}_{}'.format(sampling_rate, channels),
+                                     backend, interface_args=interface_args)
+    start = time.perf_counter()
+    experiment.run()
+    elapsed = time.perf_counter() - start
+    lags = np.array(experiment.lags)
+    # chunks waiting in the second half of the run compared to the first
+    half = len(lags) // 2
+    growing = len(lags) > 1 and lags[half:].mean() > lags[:half].mean() + 1
+    lost = experiment.interface.buffer.lost_samples
+    return {
+        'sampling_rate': sampling_rate,
+        'channels': channels,
+        'chunk_size': experiment.interface.read_chunk_size,
+        'speed': speed,
+        'elapsed_s': elapsed,
+        'max_lag_chunks': int(lags.max()) if len(lags) else 0,
+        'mean_lag_chunks': float(lags.mean()) if len(lags) else 0.0,
+        'lost_samples': int(lost),
+        'sustained': bool(lost == 0 and not growing),
+    }
+
+def run_benchmark(output_path=None, sampling_rates=(2000, 5000, 10000, 20000), channel_counts=(3, 8, 16),
+                  throughput_duration=2.0, latency_blocks=6):
+    """Run the latency and throughput benchmarks and optionally save the results as JSON.
+
+    Returns
+    -------
+    results: dict
+    """
+    results = {
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+    }
+    with tempfile.TemporaryDirectory() as root:
+        results['latency'] = measure_latency(root, n_blocks=latency_blocks)
+        results['throughput'] = [
+            measure_throughput(root, sampling_rate, channels, duration=throughput_duration)
+            for sampling_rate in sampling_rates for channels in channel_counts
+        ]
+        stop_logging()
+    sustained = [row for row in results['throughput'] if row['sustained']]
+    results['max_sustained'] = max(sustained, key=lambda row: row['sampling_rate'] * row['channels'], default=None)
+    if output_path is not None:
+        with open(output_path, 'w') as f:
+            json.dump(results, f, indent=4)
+    return results
+
+if __name__ == "__main__":
+    import sys
+
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    options = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    kwargs = {}
+    if 'rates' in options:
+        kwargs['sampling_rates'] = [int(rate) for rate in options['rates'].split(',')]
+    if 'channels' in options:
+        kwargs['channel_counts'] = [int(n) for n in options['channels'].split(',')]
+    if 'duration' in options:
+        kwargs['throughput_duration'] = float(options['duration'])
+    results = run_benchmark(args[0] if args else 'benchmark.json', **kwargs)
+    for name, summary in results['latency'].items():
+        print("{}: {}".format(name, summary))
+    for row in results['throughput']:
+        print("{sampling_rate} Hz x {channels} channels: {sustained} (max lag {max_lag_chunks} chunks)".format(**row))
@@ -0,0 +1,216 @@
+from mreye.gaze import GazeProcessor, design_matrix
+
+import json
+
+import numpy as np
+
+# targets of the default calibration block, in degrees
+DEFAULT_TARGETS = [[x, y] for y in (-5, 0, 5) for x in (-5, 0, 5)]
+# largest rms error of an accepted fit, in degrees
+MAX_RMS_ERROR = 2.0
+# smallest accepted ratio of the spread of the eye signals across targets to their scatter on one target
+MIN_SPREAD = 3.0
+
+def calibration_block(targets=None, target_duration=1.5, settle=0.5, order=1, radius=0.25, color=(255, 255, 255),
+                      max_rms_error=MAX_RMS_ERROR):
+    """A sequence block that shows `targets` one after the other and fits a calibration.
+
+    Parameters
+    ----------
+    targets: list of [x, y], optional
+        Target positions in degrees, defaults to a 3x3 grid 5 degrees apart
+    target_duration: float, optional, default: 1.5
+        Seconds each target is shown
+    settle: float, optional, default: 0.5
+        Seconds after a target appears that are not used for the fit
+    order: {1, 2}, optional, default: 1
+        1 for an affine fit, 2 for a second order polynomial
+    radius: float, optional, default: 0.25
+        Target radius in degrees
+    color: tuple, optional
+        Target color, in RGB
+    max_rms_error: float, optional, default: MAX_RMS_ERROR
+        Fits with a larger rms error in degrees are rejected
+    """
+    return {
+        'name': 'calibration', 'type': 'calibration',
+        'targets': DEFAULT_TARGETS if targets is None else targets,
+        'target_duration': target_duration, 'settle': settle, 'order': order,
+        'radius': radius, 'color': color, 'max_rms_error': max_rms_error,
+    }
+
+def fit_calibration(eye_h, eye_v, target_x, target_y, order=1, threshold=3.5, max_iterations=10,
+                    max_rms_error=MAX_RMS_ERROR, min_spread=MIN_SPREAD):
+    """Least squares fit of the map from eye signals to target positions.
+
+    Outliers are rejected with the median absolute deviation (MAD): first
+    samples whose signals are more than `threshold` scaled MADs from the
+    median signal for their target, which removes samples where the subject
+    looked away before they can bias the fit. Then, after each fit, samples
+    whose error is more than `threshold` scaled MADs above the median error,
+    until no more samples are rejected.
+
+    A fit is only accepted if the eye followed the targets: the median eye
+    signals of the targets must be spread by at least `min_spread` times the
+    scatter of the signals on one target, and the rms error must not exceed
+    `max_rms_error`. Otherwise the subject did not look at the targets, and a
+    fit would only map noise to target positions.
+
+    Parameters
+    ----------
+    eye_h, eye_v: array
+        Eye signals in volts
+    target_x, target_y: array
+        Position of the target shown at each sample, in degrees
+    order: {1, 2}, optional, default: 1
+        1 for an affine fit, 2 for a second order polynomial
+    threshold: float, optional, default: 3.5
+        Rejection threshold in robust standard deviations
+    max_iterations: int, optional, default: 10
+    max_rms_error: float, optional, default: MAX_RMS_ERROR
+        Largest accepted rms error in degrees
+    min_spread: float, optional, default: MIN_SPREAD
+        Smallest accepted ratio of the spread of the eye signals across
+        targets to their scatter on one target
+
+    Returns
+    -------
+    calibration: dict
+        `order` and `coefficients` as accepted by `GazeProcessor`, with the
+        `rms_error` in degrees of the samples kept and the number of samples
+        used and rejected
+
+    Raises
+    ------
+    ValueError
+        If there are too few samples or the fit is not accepted
+    """
+    design = design_matrix(np.asarray(eye_h, dtype=np.float64), np.asarray(eye_v, dtype=np.float64), order).T
+    targets = np.stack((target_x, target_y), axis=1).astype(np.float64)
+    if len(design) < design.shape[1]:
+        raise ValueError("Need at least {} samples to fit, got {}".format(design.shape[1], len(design)))
+    keep = np.ones(len(design), dtype=bool)
+    _, group = np.unique(targets, axis=0, return_inverse=True)
+    group = group.reshape(-1)
+    for signal in design[:, 1:3].T:
+        for g in range(group.max() + 1):
+            members = group == g
+            deviation = np.abs(signal[members] - np.median(signal[members]))
+            keep[members] &= deviation <= threshold * max(1.4826 * np.median(deviation), 1e-12)
+    if keep.sum() < design.shape[1]:
+        keep[:] = True
+    for _ in range(max_iterations):
+        coefficients, *_ = np.linalg.lstsq(design[keep], targets[keep], rcond=None)
+        error = np.linalg.norm(design @ coefficients - targets, axis=1)
+        median = np.median(error[keep])
+        mad = 1.4826 * np.median(np.abs(error[keep] - median))
+        new_keep = error <= median + threshold * max(mad, 1e-12)
+        if (new_keep == keep).all() or new_keep.sum() < design.shape[1]:
+            break
+        keep = new_keep
+
+    medians, scatter = [], []
+    for g in np.unique(group[keep]):
+        signals = design[keep & (group == g), 1:3]
+        medians.append(np.median(signals, axis=0))
+        scatter.append(1.4826 * np.median(np.abs(signals - medians[-1]), axis=0))
+    spread = np.linalg.norm(np.std(medians, axis=0)) / max(np.linalg.norm(np.median(scatter, axis=0)), 1e-12)
+    if spread < min_spread:
+        raise ValueError("Eye signals barely differ between targets ({:.2f} times their scatter, need {})".format(
+            spread, min_spread))
+    rms_error = float(np.sqrt((error[keep]**2).mean()))
+    if rms_error > max_rms_error:
+        raise ValueError("Calibration error of {:.2f} deg exceeds {} deg".format(rms_error, max_rms_error))
+    return {
+        'order': order,
+        'coefficients': coefficients.T.tolist(),
+        'rms_error': rms_error,
+        'samples': int(keep.sum()),
+        'rejected': int((~keep).sum()),
+    }
+
+def save_calibration(calibration, path):
+    with open(path, 'w') as f:
+        json.dump(calibration, f, indent=4)
+
+def load_calibration(path):
+    with open(path) as f:
+        return json.load(f)
+
+class CalibrationRun:
+    """Collects eye samples while the targets of a calibration block are shown.
+
+    The block starts at the first sample passed to `add`, and each target is
+    shown for `target_duration` seconds. Samples outside the valid signal
+    range and samples within `settle` seconds of a target appearing are not
+    collected.
+
+    Parameters
+    ----------
+    block: dict
+        The calibration block, see `calibration_block`
+    sampling_rate: float
+    start: int, optional
+        First sample of the block, defaults to the first sample passed to `add`
+    """
+    def __init__(self, block, sampling_rate, start=None):
+        self.block = block
+        self.targets = np.asarray(block['targets'], dtype=np.float64)
+        self.samples_per_target = int(round(block.get('target_duration', 1.5) * sampling_rate))
+        self.settle_samples = int(round(block.get('settle', 0.5) * sampling_rate))
+        self.start = start
+        self.collected = []
+
+    @property
+    def n_samples(self):
+        return len(self.targets) * self.samples_per_target
+
+    def target(self, i):
+        """Display object for target `i`."""
+        x, y = self.targets[i]
+        return {'type': 'circle', 'x': float(x), 'y': float(y), 'r': self.block.get('radius', 0.25),
+                'c': tuple(self.block.get('color', (255, 255, 255))), 'z': 0}
+
+    def add(self, eye_h, eye_v, start_sample):
+        """Collect a chunk of eye signals, ignoring samples before the block starts.
+
+        Returns
+        -------
+        onsets: list of (sample, target index)
+            Targets that are due to appear within this chunk
+        """
+        if self.start is None:
+            self.start = start_sample
+        n = len(eye_h)
+        offset = np.arange(start_sample, start_sample + n) - self.start
+        target = offset // self.samples_per_target
+        low, high = GazeProcessor.signal_range
+        use = ((offset >= 0) & (offset % self.samples_per_target >= self.settle_samples) & (target < len(self.targets))
+               & (eye_h >= low) & (eye_h <= high) & (eye_v >= low) & (eye_v <= high))
+        if use.any():
+            self.collected.append((eye_h[use].copy(), eye_v[use].copy(), target[use]))
+        first = (max(offset[0], 0) + self.samples_per_target - 1) // self.samples_per_target
+        last = offset[-1] // self.samples_per_target
+        return [(self.start + i * self.samples_per_target, int(i))
+                for i in range(first, min(last, len(self.targets) - 1) + 1)]
+
+    def remaining(self, sample):
+        """Number of samples from `sample` to the end of the block."""
+        if self.start is None:
+            self.start = sample
+        return self.start + self.n_samples - sample
+
+    def until_next(self, sample):
+        """Number of samples from `sample` to the next target onset or the end of the block."""
+        if self.start is None:
+            self.start = sample
+        offset = sample - self.start
+        return (offset // self.samples_per_target + 1) * self.samples_per_target - offset
+
+    def fit(self):
+        if not self.collected:
+            raise ValueError("No valid samples were collected during calibration")
+        eye_h, eye_v, target = (np.concatenate(values) for values in zip(*self.collected))
+        return fit_calibration(eye_h, eye_v, self.targets[target, 0], self.targets[target, 1],
+                               order=self.block.get('order', 1),
+                               max_rms_error=self.block.get('max_rms_error', MAX_RMS_ERROR))
@@ -0,0 +1,69 @@
+"""Declarative description of the acquired analog channels.
+
+Each channel is a dict with the `name` it is stored under, the `device`
+input it is acquired from and an optional `role`. The experiment logic finds
+the signals it needs by role rather than by position, so channels such as
+pupil size, a second eye or physiological signals can be added anywhere in
+the list without touching it.
+"""
+import math
+
+# roles the experiment logic needs, each held by exactly one channel
+REQUIRED_ROLES = ('eye_h', 'eye_v', 'trigger')
+
+DEFAULT_CHANNELS = [
+    {'name': 'eyeh', 'device': 'Dev2/ai0', 'role': 'eye_h'},
+    {'name': 'eyev', 'device': 'Dev2/ai1', 'role': 'eye_v'},
+    {'name': 'TR', 'device': 'Dev2/ai2', 'role': 'trigger'},
+]
+
+# roles of the channels of recordings made before roles were stored
+LEGACY_ROLES = {'eyeh': 'eye_h', 'eyev': 'eye_v', 'TR': 'trigger'}
+
+def channel_roles(channels):
+    """Map of channel name to role, for the channels that have one."""
+    return {channel['name']: channel['role'] for channel in channels if channel.get('role') is not None}
+
+def channel_rows(names, roles):
+    """Row of each role in data whose rows are the channels `names`.
+
+    Parameters
+    ----------
+    names: list of str
+        Channel names, in acquisition order
+    roles: dict
+        Map of channel name to role
+
+    Returns
+    -------
+    rows: dict
+        Map of role to row
+
+    Raises
+    ------
+    ValueError
+        If a name is repeated, or a required role is missing or held by
+        several channels
+    """
+    if len(set(names)) != len(names):
+        raise ValueError("Channel names must be unique: {}".format(names))
+    rows = {}
+    for row, name in enumerate(names):
+        role = roles.get(name)
+        if role is None:
+            continue
+        if role in rows:
+            raise ValueError("Channels {} and {} both have role {!r}".format(names[rows[role]], name, role))
+        rows[role] = row
+    missing = [role for role in REQUIRED_ROLES if role not in rows]
+    if missing:
+        raise ValueError("No channel with role {}".format(', '.join(repr(role) for role in missing)))
+    return rows
+
+def chunk_size_for(sampling_rate, latency_budget):
+    """Largest number of samples per read that fits in `latency_budget` seconds.
+
+    A chunk is only handed on once its last sample has been acquired, so the
+    chunk duration bounds the delay before the logic sees its first sample.
+    """
+    return max(int(math.floor(sampling_rate * latency_budget + 1e-9)), 1)
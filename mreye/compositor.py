@@ -0,0 +1,130 @@
+import bisect
+
+import numpy as np
+
+STATIC_TYPES = {'circle'}
+
+def draw_static(canvas, obj, color=None):
+    """Draw a static display object onto `canvas`, in `color` if given."""
+    import cv2
+    if obj['type'] == 'circle':
+        cv2.circle(canvas, (obj['x'], obj['y']), obj['r'], obj['c'] if color is None else color, -1)
+    else:
+        raise NotImplementedError("Unknown object type: {}".format(obj['type']))
+
+def intersect(a, b):
+    """Intersection of two (x0, y0, x1, y1) rectangles, or None."""
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[2], b[2]), min(a[3], b[3])
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return (x0, y0, x1, y1)
+
+class Compositor:
+    """Composites display objects into a reused frame, redrawing only what changed.
+
+    Objects are kept sorted by `z`. Consecutive static objects (circles) are
+    prerendered into a layer with a coverage mask whenever the display list
+    changes. Dynamic objects (videos) carry their current image in
+    `obj['frame']` at `obj['x']`, `obj['y']`; when they change, only their
+    rectangle is recomposited from the layers.
+
+    Parameters
+    ----------
+    width, height: int
+        Frame size in pixels
+    """
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.bounds = (0, 0, width, height)
+        self.frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self.objects = []
+        self.keys = []
+        self.layers = None
+
+    @property
+    def dynamic(self):
+        return [obj for obj in self.objects if obj['type'] not in STATIC_TYPES]
+
+    def add(self, obj):
+        # insert after objects of equal z, matching a stable sort
+        i = bisect.bisect_right(self.keys, obj['z'])
+        self.keys.insert(i, obj['z'])
+        self.objects.insert(i, obj)
+        self.layers = None
+
+    def remove(self, obj):
+        i = next(i for i, o in enumerate(self.objects) if o is obj)
+        del self.objects[i]
+        del self.keys[i]
+        self.layers = None
+
+    def clear(self):
+        self.objects = []
+        self.keys = []
+        self.layers = None
+
+    def build_layers(self):
+        """Split the display list into prerendered static layers and dynamic objects."""
+        self.layers = []
+        run = []
+        for obj in self.objects + [None]:
+            if obj is not None and obj['type'] in STATIC_TYPES:
+                run.append(obj)
+                continue
+            if run:
+                image = np.zeros_like(self.frame)
+                mask = np.zeros(self.frame.shape[:2], dtype=np.uint8)
+                for static in run:
+                    draw_static(image, static)
+                    draw_static(mask, static, 255)
+                ys, xs = np.nonzero(mask)
+                if len(xs):
+                    bbox = (xs.min(), ys.min(), xs.max()+1, ys.max()+1)
+                    self.layers.append(('static', image, mask.astype(bool), bbox))
+                run = []
+            if obj is not None:
+                self.layers.append(('dynamic', obj))
+
+    def object_rect(self, obj):
+        if obj.get('frame') is None:
+            return None
+        h, w = obj['frame'].shape[:2]
+        return intersect((obj['x'], obj['y'], obj['x']+w, obj['y']+h), self.bounds)
+
+    def compose(self, changed=()):
+        """Bring the frame up to date and return it.
+
+        `changed` lists the dynamic objects whose image changed since the last
+        call. The whole frame is redrawn if the display list changed.
+        """
+        if self.layers is None:
+            self.build_layers()
+            regions = [self.bounds]
+        else:
+            regions = [rect for rect in map(self.object_rect, changed) if rect is not None]
+        for region in regions:
+            self.compose_region(region)
+        return self.frame
+
+    def compose_region(self, region):
+        x0, y0, x1, y1 = region
+        view = self.frame[y0:y1, x0:x1]
+        view[:] = 0
+        for layer in self.layers:
+            if layer[0] == 'static':
+                _, image, mask, bbox = layer
+                rect = intersect(region, bbox)
+                if rect is None:
+                    continue
+                a0, b0, a1, b1 = rect
+                np.copyto(self.frame[b0:b1, a0:a1], image[b0:b1, a0:a1], where=mask[b0:b1, a0:a1, None])
+            else:
+                obj = layer[1]
+                rect = self.object_rect(obj)
+                rect = rect and intersect(region, rect)
+                if rect is None:
+                    continue
+                a0, b0, a1, b1 = rect
+                self.frame[b0:b1, a0:a1] = obj['frame'][b0-obj['y']:b1-obj['y'], a0-obj['x']:a1-obj['x']]
@@ -0,0 +1,69 @@
+from mreye.backend import Backend
+
+import time
+
+class NIDAQBackend(Backend):
+    """Acquires from and rewards through a National Instruments DAQ.
+
+    nidaqmx is only imported once a task is set up, so the backend can be
+    created on machines without NI-DAQmx installed.
+    """
+    def open(self, interface):
+        import nidaqmx
+        from nidaqmx.stream_readers import AnalogMultiChannelReader, AnalogUnscaledReader
+        self.interface = interface
+        self.read_chunk_size = interface.read_chunk_size
+        self.raw = interface.raw
+        self.task = nidaqmx.Task()
+        for channel in interface.channels:
+            self.task.ai_channels.add_ai_voltage_chan(channel['device'])
+        self.task.timing.cfg_samp_clk_timing(
+            rate=interface.sampling_rate,
+            sample_mode=nidaqmx.constants.AcquisitionType.CONTINUOUS,
+            samps_per_chan=interface.read_chunk_size
+        )
+        if self.raw:
+            self.reader = AnalogUnscaledReader(self.task.in_stream)
+            scales = [list(channel.ai_dev_scaling_coeff) for channel in self.task.ai_channels]
+        else:
+            self.reader = AnalogMultiChannelReader(self.task.in_stream)
+            scales = None
+        self.task.start()
+        return scales
+
+    def read(self, out):
+        if self.raw:
+            self.reader.read_int16(out, number_of_samples_per_channel=self.read_chunk_size)
+        else:
+            self.reader.read_many_sample(out, number_of_samples_per_channel=self.read_chunk_size)
+
+    def prepare_reward(self, interface, trace):
+        # configure, load and commit the output once so that each reward only
+        # has to start the task; stopping a finite task returns it to the
+        # committed state with the waveform still in the device buffer
+        import nidaqmx
+        from nidaqmx.stream_writers import AnalogSingleChannelWriter
+        self.reward_task = nidaqmx.Task()
+        self.reward_task.ao_channels.add_ao_voltage_chan(interface.reward_channel)
+        self.reward_task.timing.cfg_samp_clk_timing(
+            rate=interface.sampling_rate,
+            sample_mode=nidaqmx.constants.AcquisitionType.FINITE,
+            samps_per_chan=len(trace)
+        )
+        writer = AnalogSingleChannelWriter(self.reward_task.out_stream, auto_start=False)
+        writer.write_many_sample(trace)
+        self.reward_task.control(nidaqmx.constants.TaskMode.TASK_COMMIT)
+
+    def reward(self):
+        self.reward_task.start()
+        started = time.perf_counter()
+        self.reward_task.wait_until_done()
+        self.reward_task.stop()
+        return started
+
+    def close(self):
+        self.task.close()
+
+
+    def close_reward(self):
+        self.reward_task.close()
@@ -1,34 +1,64 @@
+from mreye import startup
+from mreye.compositor import Compositor
+from mreye.framecache import FrameCache
+from mreye.frametiming import FrameTimer
+from mreye.gazebuffer import GazeRingBuffer
 from mreye.getLogger import getLogger
+from mreye.render_backend import WindowBackend
+from mreye.video import VideoSource
 
 from queue import Queue, Empty
+import threading
 import time
 
-import cv2
 import numpy as np
 
+def screen_geometry(subject_rect, distance, diagonal_size):
+    """Pixels per degree of visual angle and (width, height) of the subject screen."""
+    X, Y, W, H = subject_rect
+    pixels_diagonal = (W**2 + H**2)**0.5
+    screen_angle = 2 * np.arctan((diagonal_size/2)/distance)
+    return pixels_diagonal / np.rad2deg(screen_angle), (W, H)
+
 class Display:
     SUBJECT_SCREEN_NAME = 'SUBJECT_SCREEN'
-    def __init__(self, subject_rect, distance, diagonal_size, logger=None):
+    FRAME_CACHE_DIR = 'stimulus_cache'
+    FRAME_RATE = 60
+    GAZE_CAPACITY = 8192
+    def __init__(self, subject_rect, distance, diagonal_size, logger=None, frame_cache=None, timing_path=None, render_backend=None):
         if logger is None:
-            logger = getLogger()
+            logger = getLogger('display')
         self.logger = logger
+        if render_backend is None:
+            render_backend = WindowBackend()
+        self.render_backend = render_backend
         self.subject_screen_name = self.SUBJECT_SCREEN_NAME
         self.X, self.Y, self.W, self.H = subject_rect
-        self.objects = []
-        pixels_diagonal = (self.W**2 + self.H**2)**0.5
-        screen_angle = 2 * np.arctan((diagonal_size/2)/distance)
-        self.pixels_per_degree = pixels_diagonal / np.rad2deg(screen_angle)
+        self.pixels_per_degree, _ = screen_geometry(subject_rect, distance, diagonal_size)
         self.center = (self.W//2, self.H//2)
         self.update_queue = Queue()
+        self.video_sources = {}
+        self.video_lock = threading.Lock()
+        self.frame_cache = frame_cache
+        self.compositor = Compositor(self.W, self.H)
+        self.render_interval = 1/self.FRAME_RATE
+        self.timer = FrameTimer(self.render_interval)
+        self.timing_path = timing_path
+        self.gaze = GazeRingBuffer(self.GAZE_CAPACITY)
+        self.fixation_window = None
+        # probes of the sequence's videos and preloaded frame cache entries, see `set_manifest`
+        self.video_probes = {}
+        self.cached_frames = {}
+
+    @property
+    def objects(self):
+        return self.compositor.objects
 
     def start(self):
-        cv2.namedWindow(self.subject_screen_name, cv2.WINDOW_NORMAL)
-        cv2.moveWindow(self.subject_screen_name, self.X, self.Y)
-        cv2.resizeWindow(self.subject_screen_name, self.W, self.H)
-        self.render_interval = 1/60
-        self.last_frame_time = time.time()
+        with startup.timed('window'):
+            self.render_backend.open(self.subject_screen_name, (self.X, self.Y, self.W, self.H))
         self.running = True
-        self.logger.debug("Display started")
+        self.logger.info("Display started; windows opened in {:.1f} ms".format(startup.timings['window'] * 1e3))
         self.render_loop()
 
     def post_update(self, update):
@@ -36,91 +66,211 @@ class Display:
 
     def stop(self):
         self.running = False
+        self.logger.info("Frame timing: {}".format(self.timer.next_block()))
+        if self.timing_path is not None:
+            self.timer.dump(self.timing_path)
         # self.rendering_timer.join()
         # self.logger.info('final render completed')
-        cv2.destroyAllWindows()
-        cv2.waitKey(0)
+        self.render_backend.close()
         self.logger.info('window destroyed')
 
     def render_loop(self):
+        # frames are scheduled on a fixed grid of deadlines; slots that are
+        # already past when a frame finishes are skipped and counted as missed
+        deadline = time.perf_counter()
+        missed = 0
         while self.running:
+            start = time.perf_counter()
+            self.drain_updates()
+            update_done = time.perf_counter()
+            frame = self.get_frame(self.render_interval * (1 + missed))
+            compose_done = time.perf_counter()
+            self.present(frame)
+            present_done = time.perf_counter()
+            self.timer.record(deadline, start, update_done, compose_done, present_done, missed)
+
+            deadline += self.render_interval
+            missed = max(int((present_done - deadline) // self.render_interval) + 1, 0)
+            deadline += missed * self.render_interval
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        self.stop()
+
+    def drain_updates(self):
+        while True:
             try:
-                update = self.update_queue.get(timeout=self.render_interval)
+                update = self.update_queue.get_nowait()
             except Empty:
-                pass
+                return
             try:
                 self.process_update(update)
             except Exception as e:
                 self.logger.error(e)
-            self.render_frame(time.time()-self.last_frame_time)
-        self.stop()
 
     def process_update(self, update):
         for item in update:
             if item=='CLEAR':
                 self.clear()
+                self.logger.info("Frame timing: {}".format(self.timer.next_block()))
             elif item=='QUIT':
                 self.running = False
+                self.clear()
+                with self.video_lock:
+                    for source in self.video_sources.values():
+                        source.close()
+                    self.video_sources.clear()
                 return False
             else:
                 self.add_object(**item)
         return True
 
     def get_frame(self, delta_t):
-        frame = np.zeros((self.H, self.W, 3), dtype=np.uint8)
-        for v in sorted(self.objects, key=lambda x: x['z']):
-            if v['type'] == 'circle':
-                frame = cv2.circle(frame, (v['x'], v['y']), v['r'], v['c'], -1)
-            elif v['type'] == 'video':
-                v['elapsed_time'] += delta_t
-                frames_passed = v['elapsed_time'] // v['frame_interval']
-                v['elapsed_time'] -= frames_passed * v['frame_interval']
-                if frames_passed > 1:
-                    v['cap'].set(cv2.CAP_PROP_POS_FRAMES, v['cap'].get(cv2.CAP_PROP_POS_FRAMES) + frames_passed)
-                    self.logger.warn("Dropped {} frames".format(frames_passed-1))
-                if frames_passed > 0 or v['frame'] is None:
-                    ret, video_frame = v['cap'].read()
-                    if not ret and v['loop']:
-                        v['cap'].set(cv2.CAP_PROP_POS_FRAMES, 0)
-                        ret, video_frame = v['cap'].read()
-                    elif not ret:
-                        # remove this from object list
-                        self.objects.remove(v)
-                        continue
-                    v['frame'] = video_frame
-                frame[v['y']:v['y']+v['frame'].shape[0], v['x']:v['x']+v['frame'].shape[1]] = v['frame']
-            else:
-                raise NotImplementedError("Unknown object type: {}".format(v['type']))
-        return frame
+        changed = []
+        for v in self.compositor.dynamic:
+            updated, alive = self.advance(v, delta_t)
+            if not alive:
+                self.compositor.remove(v)
+            elif updated:
+                changed.append(v)
+        return self.compositor.compose(changed)
+
+    def advance(self, v, delta_t):
+        """Move a dynamic object on by `delta_t` seconds.
+
+        Returns
+        -------
+        updated: bool
+            True if the object's image changed
+        alive: bool
+            False once the object has finished and should be removed
+        """
+        v['elapsed_time'] += delta_t
+        if v['type'] == 'video':
+            frames_passed = int(v['elapsed_time'] // v['frame_interval'])
+            v['elapsed_time'] -= frames_passed * v['frame_interval']
+            if frames_passed == 0 and v['frame'] is not None:
+                return False, True
+            try:
+                video_frame = v['source'].next_frame(skip=max(frames_passed-1, 0))
+            except Empty:
+                self.logger.warning("Video decoder behind: {}".format(v['path']))
+                return False, True
+            if video_frame is None:
+                v['source'].close()
+                return False, False
+            if frames_passed > 1:
+                self.logger.warning("Dropped {} frames".format(frames_passed-1))
+            v['frame'] = video_frame
+            return True, True
+        elif v['type'] == 'cached_video':
+            index = int(v['elapsed_time'] // v['frame_interval'])
+            if index >= len(v['frames']):
+                if not v['loop']:
+                    return False, False
+                index %= len(v['frames'])
+                v['elapsed_time'] %= len(v['frames']) * v['frame_interval']
+            if index == v['frame_index'] and v['frame'] is not None:
+                return False, True
+            v['frame_index'] = index
+            v['frame'] = v['frames'][index]
+            return True, True
+        raise NotImplementedError("Unknown object type: {}".format(v['type']))
 
     def render_frame(self, delta_t):
-        frame = self.get_frame(delta_t)
-        cv2.imshow(self.subject_screen_name, frame)
-        cv2.waitKey(1)
-        self.last_frame_time = time.time()
+        self.present(self.get_frame(delta_t))
+
+    def present(self, frame):
+        self.render_backend.show(self.subject_screen_name, frame)
+        self.render_backend.poll()
 
     def add_object(self, **kwargs):
+        if kwargs['type'] == 'fixation_window':
+            # shown to the experimenter only
+            self.fixation_window = kwargs
+            return
+        # positions precomputed by `compile_sequence`
+        pixel = kwargs.pop('pixel', None)
         if kwargs['type'] == 'circle':
-            kwargs['x'] = int(kwargs['x'] * self.pixels_per_degree + self.center[0])
-            kwargs['y'] = int(kwargs['y'] * self.pixels_per_degree + self.center[1])
-            kwargs['r'] = int(kwargs['r'] * self.pixels_per_degree)
+            if pixel is None:
+                pixel = {
+                    'x': int(kwargs['x'] * self.pixels_per_degree + self.center[0]),
+                    'y': int(kwargs['y'] * self.pixels_per_degree + self.center[1]),
+                    'r': int(kwargs['r'] * self.pixels_per_degree),
+                }
+            kwargs.update(pixel)
             kwargs['c'] = kwargs['c'][::-1] # BGR -> RGB
         elif kwargs['type'] == 'video':
-            kwargs['cap'] = cv2.VideoCapture(kwargs['path'])
-            fps = kwargs['cap'].get(cv2.CAP_PROP_FPS)
+            kwargs['loop'] = kwargs.get('loop', True)
+            kwargs['source'] = source = self.take_video(kwargs['path'])
+            source.loop = kwargs['loop']
+            probe = self.video_probes.get(kwargs['path'])
+            if probe is None:
+                source.wait_opened()
+                probe = {'fps': source.fps, 'width': source.width, 'height': source.height}
+            kwargs['frame'] = None
+            kwargs['elapsed_time'] = 0
+            kwargs['frame_interval'] = 1 / probe['fps']
+            if pixel is None:
+                pixel = {
+                    'x': int(kwargs['x'] * self.pixels_per_degree + self.center[0] - probe['width']/2),
+                    'y': int(kwargs['y'] * self.pixels_per_degree + self.center[1] - probe['height']/2),
+                }
+            kwargs.update(pixel)
+        elif kwargs['type'] == 'cached_video':
+            if kwargs['path'] in self.cached_frames:
+                kwargs['frames'], fps = self.cached_frames[kwargs['path']]
+            else:
+                kwargs['frames'], fps = self.get_frame_cache().get(kwargs['path'])
             kwargs['frame'] = None
+            kwargs['frame_index'] = 0
             kwargs['elapsed_time'] = 0
             kwargs['frame_interval'] = 1 / fps
             kwargs['loop'] = kwargs.get('loop', True)
-            video_offset_x = kwargs['cap'].get(cv2.CAP_PROP_FRAME_WIDTH) /2
-            video_offset_y = kwargs['cap'].get(cv2.CAP_PROP_FRAME_HEIGHT)/2
-            
-            kwargs['x'] = int(kwargs['x'] * self.pixels_per_degree + self.center[0] - video_offset_x)
-            kwargs['y'] = int(kwargs['y'] * self.pixels_per_degree + self.center[1] - video_offset_y)
+            if pixel is None:
+                pixel = {
+                    'x': int(kwargs['x'] * self.pixels_per_degree + self.center[0] - kwargs['frames'].shape[2]/2),
+                    'y': int(kwargs['y'] * self.pixels_per_degree + self.center[1] - kwargs['frames'].shape[1]/2),
+                }
+            kwargs.update(pixel)
         else:
             raise NotImplementedError("Unknown object type: {}".format(kwargs['type']))
-        self.logger.info(kwargs)
-        self.objects.append( kwargs )
+        self.logger.debug("Added %s at (%s, %s)", kwargs['type'], kwargs.get('x'), kwargs.get('y'))
+        self.compositor.add(kwargs)
+
+    def set_manifest(self, manifest):
+        """Take the resources of a compiled sequence, see `compile_sequence`.
+
+        Video probes replace opening each file when its block starts, and
+        cached videos are decoded into the frame cache and mapped now rather
+        than at their first use.
+        """
+        self.video_probes = dict(manifest['videos'])
+        for path in manifest['cached_videos']:
+            self.cached_frames[path] = self.get_frame_cache().get(path)
+
+    def preload(self, paths):
+        """Start opening and decoding the videos in `paths` ahead of their use."""
+        with self.video_lock:
+            for path in paths:
+                if path not in self.video_sources:
+                    self.video_sources[path] = VideoSource(path)
+
+    def get_frame_cache(self):
+        if self.frame_cache is None:
+            self.frame_cache = FrameCache(self.FRAME_CACHE_DIR, self.W, self.H, logger=self.logger)
+        return self.frame_cache
+
+    def take_video(self, path):
+        with self.video_lock:
+            source = self.video_sources.pop(path, None)
+        if source is None:
+            source = VideoSource(path)
+        return source
 
     def clear(self):
-        self.objects = []
+        for v in self.objects:
+            if v['type'] == 'video':
+                v['source'].close()
+        self.compositor.clear()
+        self.fixation_window = None
@@ -0,0 +1,84 @@
+from mreye.gazebuffer import GazeRingBuffer
+from mreye.getLogger import getLogger
+
+import multiprocessing
+import threading
+
+def run_display(conn, gaze_name, gaze_capacity, display_class, args, kwargs, logger_args):
+    """Entry point of the display process."""
+    gaze = GazeRingBuffer.attach(gaze_name, gaze_capacity)
+    display = display_class(*args, logger=getLogger(**logger_args), **kwargs)
+    display.gaze = gaze
+
+    def receive():
+        while True:
+            try:
+                command, payload = conn.recv()
+            except EOFError:
+                display.post_update(['QUIT'])
+                return
+            if command == 'update':
+                display.post_update(payload)
+                if 'QUIT' in payload:
+                    return
+            elif command == 'preload':
+                display.preload(payload)
+            elif command == 'manifest':
+                display.set_manifest(payload)
+
+    threading.Thread(target=receive, name="display_commands", daemon=True).start()
+    try:
+        display.start()
+    finally:
+        gaze.close()
+
+class DisplayProcess:
+    """Runs a `Display` in its own process.
+
+    Stimulus commands are sent to the process over a pipe, and gaze samples are
+    exchanged through a `GazeRingBuffer` in shared memory, so compositing and
+    video decoding never compete with acquisition for the GIL.
+
+    Parameters
+    ----------
+    display_class: type
+        `Display` or a subclass such as `MultiWindowDisplay`
+    *args
+        Positional arguments for `display_class`
+    logger_args: dict, optional
+        Arguments for `getLogger` in the display process
+    gaze_capacity: int, optional, default: 8192
+        Number of gaze samples shared with the display
+    **kwargs
+        Keyword arguments for `display_class`; they must be picklable
+    """
+    def __init__(self, display_class, *args, logger_args=None, gaze_capacity=8192, **kwargs):
+        if logger_args is None:
+            logger_args = {'name': 'display'}
+        self.gaze = GazeRingBuffer.create_shared(gaze_capacity)
+        # the parent already runs acquisition, writer and logging threads, and
+        # a forked child could inherit locks held by them
+        context = multiprocessing.get_context('spawn')
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=run_display, name="display",
+            args=(child_conn, self.gaze.name, gaze_capacity, display_class, args, kwargs, logger_args),
+        )
+
+    def start(self):
+        """Start the display process and return immediately."""
+        self.process.start()
+
+    def post_update(self, update):
+        self.conn.send(('update', update))
+
+    def preload(self, paths):
+        self.conn.send(('preload', paths))
+
+    def set_manifest(self, manifest):
+        self.conn.send(('manifest', manifest))
+
+    def join(self):
+        self.process.join()
+        self.conn.close()
+        self.gaze.close(unlink=True)
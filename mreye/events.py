@@ -0,0 +1,110 @@
+from mreye.getLogger import getLogger
+
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+_FLUSH = object()
+_STOP = object()
+
+def event_record(name, args, sample, host, sampling_rate):
+    """The dict stored for an event.
+
+    `host` is seconds since the experiment started. Events tied to a sample
+    also carry the DAQ time of that sample.
+    """
+    record = {'name': name, 'args': list(args), 'host': round(host, 6)}
+    if sample is not None:
+        record['sample'] = int(sample)
+        record['daq'] = round(int(sample) / sampling_rate, 6)
+    return record
+
+def dump_event(record):
+    # numpy scalars (e.g. sample counts) are not JSON serializable
+    return json.dumps(record, separators=(',', ':'), default=lambda value: value.item())
+
+def read_events(path):
+    """Read the event records of an events.jsonl file."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+class EventRecorder:
+    """Records experiment events to a JSON lines file from a dedicated thread.
+
+    `record` only timestamps the event and queues it, so it can be called from
+    the real-time loop. The writer thread formats queued events and appends
+    them to the file, one JSON object per line, at least every
+    `flush_interval` seconds and whenever `flush` is called.
+
+    Parameters
+    ----------
+    path: str or Path
+        File the events are appended to
+    sampling_rate: float
+        Sampling rate used to convert sample indices to DAQ time
+    logger: logging.Logger, optional
+    flush_interval: float, optional
+        Maximum number of seconds events are held before being written
+    """
+    flush_interval = 1.0
+
+    def __init__(self, path, sampling_rate, logger=None, flush_interval=None):
+        if logger is None:
+            logger = getLogger('events')
+        self.logger = logger
+        self.path = Path(path)
+        self.sampling_rate = sampling_rate
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+        self.pending = queue.SimpleQueue()
+        self.recorded = 0
+        self.thread = None
+
+    def start(self, start_time):
+        """Start the writer thread; host times are relative to `start_time`."""
+        self.start_time = start_time
+        self.file = open(self.path, 'a')
+        self.thread = threading.Thread(target=self.run, name="events", daemon=True)
+        self.thread.start()
+
+    def record(self, name, *args, sample=None):
+        """Queue an event. Never blocks on I/O."""
+        self.pending.put((name, args, sample, time.time()))
+
+    def flush(self):
+        """Write everything queued so far and flush the file to disk."""
+        self.pending.put(_FLUSH)
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.pending.put(_STOP)
+        self.thread.join()
+        self.thread = None
+        self.logger.info("Event recorder stopped: {} events".format(self.recorded))
+
+    def run(self):
+        last_flush_time = time.monotonic()
+        while True:
+            timeout = max(last_flush_time + self.flush_interval - time.monotonic(), 0)
+            try:
+                item = self.pending.get(timeout=timeout)
+            except queue.Empty:
+                self.file.flush()
+                last_flush_time = time.monotonic()
+                continue
+            if item is _FLUSH or item is _STOP:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                last_flush_time = time.monotonic()
+                if item is _STOP:
+                    self.file.close()
+                    break
+                continue
+            name, args, sample, host_time = item
+            record = event_record(name, args, sample, host_time - self.start_time, self.sampling_rate)
+            self.file.write(dump_event(record) + '\n')
+            self.recorded += 1
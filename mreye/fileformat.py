@@ -0,0 +1,108 @@
+"""On-disk format of the analog data recorded by `Interface`.
+
+A data file starts with a fixed-size header::
+
+    MAGIC (8 bytes) | version (uint16) | metadata length (uint32) | metadata (JSON) | zero padding
+
+followed by the samples, stored sample-major (one row of `n_channels` values per
+sample) so that a single channel is a constant-stride view of the file. The
+metadata records the channel names, sampling rate, sample dtype, the
+polynomial scale coefficients that convert raw counts to volts and the wall
+clock time of the first sample.
+
+Next to the data file a sparse index (same name, `.idx` suffix) stores pairs of
+(sample offset, wall clock time) so any time can be mapped to a sample without
+scanning the data.
+"""
+import json
+from pathlib import Path
+import struct
+
+import numpy as np
+
+MAGIC = b'MREYEDAT'
+VERSION = 1
+HEADER_SIZE = 4096
+_PREAMBLE = struct.Struct('<8sHI')
+INDEX_DTYPE = np.dtype([('sample', '<i8'), ('time', '<f8')])
+
+def make_header(channels, sampling_rate, dtype, scales=None, start_time=None, **metadata):
+    """Build the header bytes for a data file.
+
+    Parameters
+    ----------
+    channels: list of str
+        Channel names, in the order they are stored
+    sampling_rate: float
+        Samples per second per channel
+    dtype: numpy dtype
+        Data type of the stored samples
+    scales: list of list of float, optional
+        Per channel polynomial coefficients (lowest order first) mapping stored
+        values to volts. None if samples are stored in volts.
+    start_time: float, optional
+        Wall clock time (seconds since epoch) of the first sample
+    **metadata
+        Additional JSON-serialisable values to store
+
+    Returns
+    -------
+    header: bytes
+        Exactly HEADER_SIZE bytes
+    """
+    metadata.update(
+        channels=list(channels),
+        sampling_rate=sampling_rate,
+        dtype=np.dtype(dtype).str,
+        layout='sample_major',
+        scales=scales,
+        start_time=start_time,
+    )
+    payload = json.dumps(metadata).encode('utf-8')
+    if _PREAMBLE.size + len(payload) > HEADER_SIZE:
+        raise ValueError("Header metadata too large: {} bytes".format(len(payload)))
+    header = _PREAMBLE.pack(MAGIC, VERSION, len(payload)) + payload
+    return header.ljust(HEADER_SIZE, b'\0')
+
+def read_header(path):
+    """Read the header of a data file.
+
+    Returns
+    -------
+    metadata: dict or None
+        The header metadata with an added `data_offset` key, or None if the file
+        has no header (legacy float64 recordings).
+    """
+    with open(path, 'rb') as f:
+        preamble = f.read(_PREAMBLE.size)
+        if len(preamble) < _PREAMBLE.size:
+            return None
+        magic, version, length = _PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            return None
+        if version > VERSION:
+            raise ValueError("Unsupported data file version {} in {}".format(version, path))
+        metadata = json.loads(f.read(length).decode('utf-8'))
+    metadata['version'] = version
+    metadata['data_offset'] = HEADER_SIZE
+    return metadata
+
+def scale_counts(counts, scales, out):
+    """Convert raw counts, shaped (channels, samples), to volts in place in `out`."""
+    for counts_row, out_row, coeffs in zip(counts, out, scales):
+        # Horner's scheme, without temporaries
+        out_row[:] = coeffs[-1]
+        for c in coeffs[-2::-1]:
+            np.multiply(out_row, counts_row, out=out_row)
+            out_row += c
+    return out
+
+def index_path(path):
+    return Path(path).with_suffix('.idx')
+
+def read_index(path):
+    """Read the sparse (sample, time) index stored next to a data file."""
+    try:
+        return np.fromfile(index_path(path), dtype=INDEX_DTYPE)
+    except FileNotFoundError:
+        return np.zeros(0, dtype=INDEX_DTYPE)
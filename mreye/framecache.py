@@ -0,0 +1,160 @@
+from mreye.getLogger import getLogger
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+import time
+
+import numpy as np
+
+def fit_size(width, height, max_width, max_height):
+    """Size of a `width` x `height` frame shrunk to fit the screen, as stored in the cache."""
+    scale = min(1, max_width / width, max_height / height)
+    return max(int(width * scale), 1), max(int(height * scale), 1)
+
+class FrameCache:
+    """Stimulus videos decoded once into memory-mapped uint8 frame arrays.
+
+    Each entry holds every frame of a video, shrunk to fit a `width` x `height`
+    subject screen, as an (n_frames, height, width, 3) .npy file. Entries are
+    keyed by the hash of the source file and the screen size, and the least
+    recently used entries are deleted once the cache grows past `max_bytes`.
+
+    Parameters
+    ----------
+    root: str or Path
+        Cache directory
+    width, height: int
+        Subject screen size in pixels
+    max_bytes: int, optional, default: 20 GiB
+        Total size the cache is trimmed to
+    logger: logging.Logger, optional
+    """
+    max_bytes = 20 * 2**30
+
+    def __init__(self, root, width, height, max_bytes=None, logger=None):
+        if logger is None:
+            logger = getLogger('framecache')
+        self.logger = logger
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.width = width
+        self.height = height
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        self.index_path = self.root/'index.json'
+        self.lock = threading.Lock()
+        try:
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        except FileNotFoundError:
+            self.index = {'entries': {}, 'sources': {}}
+
+    def save_index(self):
+        tmp = self.index_path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp, self.index_path)
+
+    def source_hash(self, path):
+        """Content hash of `path`, recomputed only when its size or mtime change."""
+        path = str(Path(path).resolve())
+        stat = os.stat(path)
+        known = self.index['sources'].get(path)
+        if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self.index['sources'][path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def key(self, path):
+        return "{}_{}x{}".format(self.source_hash(path), self.width, self.height)
+
+    def get(self, path):
+        """Return (frames, fps) for the video at `path`, decoding it if not cached."""
+        with self.lock:
+            key = self.key(path)
+            entry = self.index['entries'].get(key)
+            if entry is None or not (self.root/entry['file']).exists():
+                entry = self.build(path, key)
+            entry['last_used'] = time.time()
+            self.save_index()
+        frames = np.load(self.root/entry['file'], mmap_mode='r')
+        return frames, entry['fps']
+
+    def build(self, path, key):
+        import cv2
+        self.logger.info("Decoding {} into the frame cache".format(path))
+        cap = cv2.VideoCapture(str(path))
+        if not cap.isOpened():
+            raise IOError("Could not open video: {}".format(path))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if not fps > 0:
+            raise IOError("Video has no frame rate: {}".format(path))
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        size = fit_size(width, height, self.width, self.height)
+        n_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        file = key + '.npy'
+        tmp = self.root/(key + '.tmp.npy')
+        frames = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.uint8, shape=(n_frames, size[1], size[0], 3))
+        count = 0
+        while count < n_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if size != (width, height):
+                frames[count] = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            else:
+                frames[count] = frame
+            count += 1
+        cap.release()
+        frames.flush()
+        del frames
+        if count < n_frames:
+            # the container overstated its frame count
+            self.logger.warning("{} has {} frames, expected {}".format(path, count, n_frames))
+            np.save(self.root/file, np.load(tmp, mmap_mode='r')[:count])
+            os.remove(tmp)
+        else:
+            os.replace(tmp, self.root/file)
+
+        entry = {
+            'file': file, 'source': str(path), 'fps': fps, 'n_frames': count,
+            'bytes': os.path.getsize(self.root/file), 'last_used': time.time(),
+        }
+        self.index['entries'][key] = entry
+        self.evict(keep=key)
+        return entry
+
+    def evict(self, keep=None):
+        """Delete least recently used entries until the cache fits in `max_bytes`."""
+        entries = self.index['entries']
+        total = sum(entry['bytes'] for entry in entries.values())
+        for key in sorted(entries, key=lambda k: entries[k]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            entry = entries.pop(key)
+            total -= entry['bytes']
+            try:
+                os.remove(self.root/entry['file'])
+            except FileNotFoundError:
+                pass
+            self.logger.info("Evicted {} from the frame cache".format(entry['source']))
+
+if __name__ == "__main__":
+    import sys
+
+    root, width, height = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+    cache = FrameCache(root, width, height, logger=getLogger('framecache', printLevel='INFO'))
+    for path in sys.argv[4:]:
+        frames, fps = cache.get(path)
+        print("{}: {} frames of {}x{} at {} fps".format(path, frames.shape[0], frames.shape[2], frames.shape[1], fps))
@@ -0,0 +1,74 @@
+import numpy as np
+
+FRAME_DTYPE = np.dtype([
+    ('frame', '<i8'),
+    ('block', '<i4'),
+    ('deadline', '<f8'),
+    ('start', '<f8'),
+    ('update', '<f8'),
+    ('compose', '<f8'),
+    ('present', '<f8'),
+    ('missed', '<i4'),
+])
+
+class FrameTimer:
+    """Per frame timestamps kept in a preallocated ring.
+
+    Each record holds the frame's scheduled deadline and the `time.perf_counter`
+    times at which the frame started, finished applying updates, finished
+    compositing and finished presenting, plus the number of grid slots missed
+    before it.
+
+    Parameters
+    ----------
+    interval: float
+        Target frame interval in seconds
+    capacity: int, optional, default: 2**18
+        Number of frames kept; older frames are overwritten
+    """
+    def __init__(self, interval, capacity=2**18):
+        self.interval = interval
+        self.records = np.zeros(capacity, dtype=FRAME_DTYPE)
+        self.count = 0
+        self.block = 0
+        self.block_start = 0
+
+    def record(self, deadline, start, update, compose, present, missed):
+        self.records[self.count % len(self.records)] = (
+            self.count, self.block, deadline, start, update, compose, present, missed)
+        self.count += 1
+
+    def ordered(self, since=0):
+        """Records from frame `since` on that are still in the ring, oldest first."""
+        since = max(since, self.count - len(self.records))
+        index = np.arange(since, self.count) % len(self.records)
+        return self.records[index]
+
+    def summary(self, since=0):
+        records = self.ordered(since)
+        if len(records) < 2:
+            return {'frames': len(records)}
+        intervals = np.diff(records['present'])
+        lateness = records['present'] - records['deadline']
+        return {
+            'frames': len(records),
+            'dropped': int(records['missed'].sum()),
+            'interval_mean_ms': float(intervals.mean() * 1e3),
+            'jitter_ms': float(intervals.std() * 1e3),
+            'interval_max_ms': float(intervals.max() * 1e3),
+            'lateness_p99_ms': float(np.percentile(lateness, 99) * 1e3),
+            'update_max_ms': float((records['update'] - records['start']).max() * 1e3),
+            'compose_mean_ms': float((records['compose'] - records['update']).mean() * 1e3),
+            'present_mean_ms': float((records['present'] - records['compose']).mean() * 1e3),
+        }
+
+    def next_block(self):
+        """Close the current block and return its summary."""
+        summary = self.summary(self.block_start)
+        summary['block'] = self.block
+        self.block += 1
+        self.block_start = self.count
+        return summary
+
+    def dump(self, path):
+        np.save(path, self.ordered())
@@ -0,0 +1,171 @@
+from collections import namedtuple
+
+import numpy as np
+
+Gaze = namedtuple('Gaze', ['x', 'y', 'saccade', 'blink'])
+
+def design_matrix(h, v, order=1):
+    """Polynomial terms of the eye signals, shaped (terms, samples).
+
+    The terms are 1, h, v for `order` 1, followed by h*h, h*v, v*v for
+    `order` 2.
+    """
+    terms = [np.ones_like(h), h, v]
+    if order == 2:
+        terms += [h*h, h*v, v*v]
+    elif order != 1:
+        raise ValueError("Unsupported calibration order: {}".format(order))
+    return np.stack(terms)
+
+def calibration_coefficients(calibration):
+    """The order and (2, terms) coefficients mapping volts to degrees.
+
+    `calibration` is either a dict with `order` and `coefficients` (the rows
+    for x and y of the terms of `design_matrix`), or the gain/offset dict of
+    `Experiment.eye_calibration`, for which x = (h + offset_x) * gain_x.
+    """
+    if 'coefficients' in calibration:
+        order = calibration.get('order', 1)
+        coefficients = np.asarray(calibration['coefficients'], dtype=np.float64)
+    else:
+        gain, offset = calibration['gain'], calibration['offset']
+        order = 1
+        coefficients = np.array([
+            [offset['x'] * gain['x'], gain['x'], 0],
+            [offset['y'] * gain['y'], 0, gain['y']],
+        ], dtype=np.float64)
+    n_terms = 3 if order == 1 else 6
+    if coefficients.shape != (2, n_terms):
+        raise ValueError("Expected {} coefficients per axis for order {}, got shape {}".format(
+            n_terms, order, coefficients.shape))
+    return order, coefficients
+
+def lowpass_taps(sampling_rate, cutoff, n_taps):
+    """Hamming windowed sinc low-pass filter with unit gain at DC."""
+    n = np.arange(n_taps) - (n_taps - 1) / 2
+    taps = np.sinc(2 * cutoff / sampling_rate * n) * np.hamming(n_taps)
+    return taps / taps.sum()
+
+class GazeProcessor:
+    """Turns chunks of eye signals into calibrated, filtered gaze with event flags.
+
+    Each chunk goes through these steps:
+
+    - blink detection: samples where either signal is outside
+      `signal_range` volts (the eye tracker rails during blinks), extended by
+      `blink_padding` seconds
+    - calibration from volts to degrees
+    - a causal FIR low-pass filter, with blink samples held at the last good
+      position so they do not smear into their neighbours
+    - saccade detection: samples where the filtered gaze moves faster than
+      `saccade_velocity`, measured over the last `velocity_duration` seconds
+      so the threshold does not depend on the sampling rate
+
+    Filter and velocity state is carried from one chunk to the next, so
+    processing a recording in chunks of any size gives the same result.
+
+    Parameters
+    ----------
+    sampling_rate: float
+        Samples per second
+    calibration: dict
+        See `calibration_coefficients`
+    cutoff: float, optional, default: 100
+        Low-pass cutoff in Hz
+    filter_duration: float, optional, default: 0.01
+        Length of the filter in seconds; the filter delays gaze by half of it
+    saccade_velocity: float, optional, default: 30
+        Velocity threshold in degrees per second
+    velocity_duration: float, optional, default: 0.02
+        Time span in seconds over which the velocity is measured
+    signal_range: tuple of float, optional, default: (-9.5, 9.5)
+        Valid range of the eye signals in volts
+    blink_padding: float, optional, default: 0.05
+        Seconds flagged as blink after the signals return to the valid range
+    """
+    cutoff = 100
+    filter_duration = 0.01
+    saccade_velocity = 30
+    velocity_duration = 0.02
+    signal_range = (-9.5, 9.5)
+    blink_padding = 0.05
+
+    def __init__(self, sampling_rate, calibration, cutoff=None, filter_duration=None,
+                 saccade_velocity=None, velocity_duration=None, signal_range=None, blink_padding=None):
+        self.sampling_rate = sampling_rate
+        if cutoff is not None:
+            self.cutoff = cutoff
+        if filter_duration is not None:
+            self.filter_duration = filter_duration
+        if saccade_velocity is not None:
+            self.saccade_velocity = saccade_velocity
+        if velocity_duration is not None:
+            self.velocity_duration = velocity_duration
+        if signal_range is not None:
+            self.signal_range = signal_range
+        if blink_padding is not None:
+            self.blink_padding = blink_padding
+        self.order, self.coefficients = calibration_coefficients(calibration)
+        n_taps = max(int(round(self.filter_duration * sampling_rate)) | 1, 1)
+        self.taps = lowpass_taps(sampling_rate, self.cutoff, n_taps)
+        self.padding_samples = int(round(self.blink_padding * sampling_rate))
+        self.velocity_samples = max(int(round(self.velocity_duration * sampling_rate)), 1)
+        # displacement over velocity_samples above which the eye is saccading, squared
+        self.step_threshold = (self.saccade_velocity * self.velocity_samples / sampling_rate) ** 2
+        self.reset()
+
+    def reset(self):
+        """Forget the state carried over from previous chunks."""
+        self.history = None
+        self.last_good = None
+        self.last_filtered = None
+        # index of the last out of range sample, relative to the next chunk
+        self.last_blink = -2**62
+
+    def calibrate(self, eye_h, eye_v):
+        """Map volts to degrees, returning an array shaped (2, samples)."""
+        return self.coefficients @ design_matrix(eye_h, eye_v, self.order)
+
+    def process(self, eye_h, eye_v):
+        """Process the next chunk of the horizontal and vertical eye signals, in volts.
+
+        Returns
+        -------
+        gaze: Gaze
+            Filtered x and y in degrees, and boolean `saccade` and `blink`
+            flags for every sample
+        """
+        n = len(eye_h)
+        index = np.arange(n)
+        low, high = self.signal_range
+        out_of_range = (eye_h < low) | (eye_h > high) | (eye_v < low) | (eye_v > high)
+        last_blink = np.maximum.accumulate(np.where(out_of_range, index, self.last_blink))
+        blink = index - last_blink <= self.padding_samples
+        self.last_blink = last_blink[-1] - n
+
+        position = self.calibrate(eye_h, eye_v)
+        if self.last_good is None:
+            good = np.flatnonzero(~blink)
+            self.last_good = position[:, good[0]].copy() if len(good) else np.zeros(2)
+        if blink.any():
+            # hold the last good position through blinks
+            last_good = np.maximum.accumulate(np.where(blink, -1, index))
+            position = np.where(last_good >= 0, position[:, np.maximum(last_good, 0)], self.last_good[:, None])
+        self.last_good = position[:, -1].copy()
+
+        if self.history is None:
+            # start as if the eye had rested at its first position
+            self.history = np.repeat(position[:, :1], len(self.taps) - 1, axis=1)
+        padded = np.concatenate((self.history, position), axis=1)
+        filtered = np.empty_like(position)
+        for axis in range(2):
+            filtered[axis] = np.convolve(padded[axis], self.taps, mode='valid')
+        self.history = padded[:, n:]
+
+        if self.last_filtered is None:
+            self.last_filtered = np.repeat(filtered[:, :1], self.velocity_samples, axis=1)
+        recent = np.concatenate((self.last_filtered, filtered), axis=1)
+        steps = filtered - recent[:, :n]
+        saccade = ((steps ** 2).sum(axis=0) > self.step_threshold) & ~blink
+        self.last_filtered = recent[:, -self.velocity_samples:]
+        return Gaze(filtered[0], filtered[1], saccade, blink)
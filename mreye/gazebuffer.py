@@ -0,0 +1,97 @@
+import numpy as np
+
+class GazeRingBuffer:
+    """Ring of the latest (x, y) gaze samples with a single writer and no locks.
+
+    The buffer holds two sample counters followed by the samples, and may live
+    in shared memory so another process can read it. Like a seqlock, the
+    writer advances the `started` counter before it stores samples and the
+    `count` counter after. Readers copy up to `count` and then check `started`,
+    dropping every copied sample whose slot a write had started on, so a
+    reader never returns samples that were overwritten while it copied them.
+
+    Parameters
+    ----------
+    capacity: int, optional, default: 8192
+        Number of samples kept
+    buffer: buffer, optional
+        Memory to use, at least `nbytes(capacity)` long; private memory is
+        allocated if not given
+    """
+    def __init__(self, capacity=8192, buffer=None):
+        self.capacity = capacity
+        if buffer is None:
+            buffer = bytearray(self.nbytes(capacity))
+        self.shm = None
+        # samples whose write has started, and samples written
+        self.counters = np.ndarray((2,), dtype=np.int64, buffer=buffer)
+        self.samples = np.ndarray((2, capacity), dtype=np.float64, buffer=buffer, offset=16)
+
+    @staticmethod
+    def nbytes(capacity):
+        return 16 + 2 * 8 * capacity
+
+    @classmethod
+    def create_shared(cls, capacity=8192):
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(create=True, size=cls.nbytes(capacity))
+        gaze = cls(capacity, shm.buf)
+        gaze.counters[:] = 0
+        gaze.shm = shm
+        return gaze
+
+    @classmethod
+    def attach(cls, name, capacity):
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(name=name)
+        gaze = cls(capacity, shm.buf)
+        gaze.shm = shm
+        return gaze
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def started(self):
+        return int(self.counters[0])
+
+    @property
+    def count(self):
+        return int(self.counters[1])
+
+    def write(self, x, y):
+        n = len(x)
+        end = self.count + n
+        self.counters[0] = end
+        if n > self.capacity:
+            x, y = x[-self.capacity:], y[-self.capacity:]
+            n = self.capacity
+        start = (end - n) % self.capacity
+        first = min(n, self.capacity - start)
+        self.samples[0, start:start+first] = x[:first]
+        self.samples[1, start:start+first] = y[:first]
+        self.samples[0, :n-first] = x[first:]
+        self.samples[1, :n-first] = y[first:]
+        self.counters[1] = end
+
+    def latest(self, n):
+        """Return a copy of up to the last `n` samples, shaped (2, samples)."""
+        end = self.count
+        n = min(n, end, self.capacity)
+        index = np.arange(end - n, end) % self.capacity
+        out = self.samples[:, index]
+        # drop samples in slots a write started on while they were being copied
+        overwritten = self.started - self.capacity - (end - n)
+        if overwritten > 0:
+            out = out[:, overwritten:]
+        return out
+
+    def close(self, unlink=False):
+        if self.shm is None:
+            return
+        del self.counters, self.samples
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+        self.shm = None
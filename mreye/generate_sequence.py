@@ -1,13 +1,17 @@
 from pathlib import Path
 import random
 
-def generate_sequence(stimulus_list=None):
+def generate_sequence(stimulus_list=None, calibrate=False):
     BASELINE = {'name': 'baseline', 'n_triggers': 14}
     PRE_TRIGGERS = {'name': 'pre_triggers', 'n_triggers': 31}
     if stimulus_list is None:
         stimulus_list = list(Path('stimuli').glob('*.avi')) + [None]*3
         random.shuffle(stimulus_list)
     sequence = [PRE_TRIGGERS] 
+    if calibrate:
+        # imported here so generating a sequence does not load numpy
+        from mreye.calibration import calibration_block
+        sequence.insert(0, calibration_block())
     # sequence = []
     for stimulus in stimulus_list:
         sequence.append(BASELINE)
@@ -1,4 +1,122 @@
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import threading
+import time
+
+# state of the queue mode shared by all loggers created with queued=True
+_queue = None
+_listener = None
+_targets = {}
+_files = {}
+_lock = threading.Lock()
+# held while a record is written, so a fork never copies a half written handler
+_dispatch_lock = threading.Lock()
+
+class RateLimitFilter(logging.Filter):
+    """Drops repeats of a warning within `interval` seconds.
+
+    Messages that only differ in their numbers count as repeats, so
+    "Dropped 2 frames" and "Dropped 5 frames" are limited together. The next
+    message that passes reports how many were dropped.
+
+    Parameters
+    ----------
+    interval: float, optional, default: 1.0
+        Minimum number of seconds between repeats
+    level: int, optional, default: logging.WARNING
+        Records below this level are never dropped
+    """
+    def __init__(self, interval=1.0, level=logging.WARNING):
+        super().__init__()
+        self.interval = interval
+        self.level = level
+        self.last = {}
+
+    def filter(self, record):
+        if record.levelno < self.level:
+            return True
+        key = (record.name, record.levelno, re.sub(r"\d+", "#", str(record.msg)))
+        now = time.monotonic()
+        last, suppressed = self.last.get(key, (None, 0))
+        if last is not None and now - last < self.interval:
+            self.last[key] = (last, suppressed + 1)
+            return False
+        self.last[key] = (now, 0)
+        if suppressed:
+            record.msg = "{} ({} similar messages suppressed)".format(record.getMessage(), suppressed)
+            record.args = None
+        return True
+
+class _Dispatcher(logging.Handler):
+    """Hands records taken off the queue to the handlers of their logger."""
+    def handle(self, record):
+        with _dispatch_lock:
+            for level, handler in _targets.get(record.name, []):
+                if record.levelno >= level:
+                    handler.handle(record)
+        return True
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Puts records on the shared queue, starting a listener in a forked child."""
+    def enqueue(self, record):
+        if _queue is None:
+            with _lock:
+                _start_listener()
+        _queue.put_nowait(record)
+
+def _start_listener():
+    global _queue, _listener
+    if _listener is None:
+        _queue = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(_queue, _Dispatcher())
+        _listener.start()
+        # multiprocessing ends forked children with os._exit, which skips atexit
+        util = sys.modules.get('multiprocessing.util')
+        if util is not None:
+            util.Finalize(None, stop_logging, exitpriority=0)
+    return _queue
+
+def stop_logging():
+    """Write out queued records and stop the thread serving queued loggers."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+            for handlers in _targets.values():
+                for _, handler in handlers:
+                    try:
+                        handler.flush()
+                    except ValueError:
+                        # the stream was already closed, e.g. by a test runner
+                        pass
+
+atexit.register(stop_logging)
+
+def _reset_after_fork():
+    """Drop the parent's queue state in a forked child.
+
+    The listener thread does not survive a fork, so the child starts its own
+    on its first queued record. Records the parent had not written yet are
+    left to the parent. Loggers inherited from the parent keep their handlers.
+    """
+    global _queue, _listener, _lock, _dispatch_lock
+    _lock = threading.Lock()
+    _dispatch_lock = threading.Lock()
+    _queue = None
+    _listener = None
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(
+        before=lambda: _dispatch_lock.acquire(),
+        after_in_parent=lambda: _dispatch_lock.release(),
+        after_in_child=_reset_after_fork,
+    )
 
 def getLogger(
     name,
@@ -7,6 +125,8 @@ def getLogger(
     fileLevel="DEBUG",
     printLevel="WARN",
     capture_warnings=True,
+    queued=False,
+    rate_limit=None,
 ):
     """Utility that returns a logger object
 
@@ -26,6 +146,13 @@ def getLogger(
         Captures warnings to be processed by logger
     capture_errors: bool, optional, default: True
         Captures errors to be processed by logger
+    queued: bool, optional, default: False
+        If True the logger only puts records on a queue, and a single thread
+        shared by all queued loggers writes them to the file and console, so
+        logging never waits on I/O
+    rate_limit: float, optional
+        Minimum number of seconds between repeats of a warning, see
+        `RateLimitFilter`
 
     Returns
     -------
@@ -38,8 +165,10 @@ def getLogger(
 
     if logger.hasHandlers():
         logger.handlers[:] = []
+    logger.filters[:] = []
 
     logger.setLevel(logging.DEBUG)
+    handlers = []
     formatter = logging.Formatter(
         "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     )
@@ -49,10 +178,19 @@ def getLogger(
             raise ValueError(
                 f"Provided invalid fileLevel '{fileLevel}'. Valid options: {logger_levels.keys()}"
             )
-        fileHandler = logging.FileHandler(fileName, mode=fileMode)
-        fileHandler.setLevel(logger_levels[fileLevel])
-        fileHandler.setFormatter(formatter)
-        logger.addHandler(fileHandler)
+        if queued:
+            # queued loggers writing to the same file share its handler
+            with _lock:
+                path = os.path.abspath(fileName)
+                if path not in _files:
+                    _files[path] = logging.FileHandler(fileName, mode=fileMode)
+                    _files[path].setFormatter(formatter)
+                fileHandler = _files[path]
+        else:
+            fileHandler = logging.FileHandler(fileName, mode=fileMode)
+            fileHandler.setLevel(logger_levels[fileLevel])
+            fileHandler.setFormatter(formatter)
+        handlers.append((logger_levels[fileLevel], fileHandler))
 
     if not printLevel in logger_levels:
         raise ValueError(
@@ -60,5 +198,20 @@ def getLogger(
         )
     streamHandler = logging.StreamHandler()
     streamHandler.setLevel(printLevel)
-    logger.addHandler(streamHandler)
+    handlers.append((streamHandler.level, streamHandler))
+
+    if rate_limit is not None:
+        logger.addFilter(RateLimitFilter(rate_limit))
+    if queued:
+        with _lock:
+            _targets[name] = handlers
+            queueHandler = _QueueHandler(_start_listener())
+        # records no handler wants are dropped before they are queued
+        queueHandler.setLevel(min(level for level, _ in handlers))
+        logger.addHandler(queueHandler)
+    else:
+        with _lock:
+            _targets.pop(name, None)
+        for _, handler in handlers:
+            logger.addHandler(handler)
     return logger
\ No newline at end of file
@@ -1,107 +1,185 @@
-import nidaqmx
-from nidaqmx.constants import TerminalConfiguration
-import nidaqmx.system
-from nidaqmx.stream_readers import AnalogMultiChannelReader, AnalogSingleChannelReader
-from nidaqmx.stream_writers import AnalogSingleChannelWriter
+from mreye import startup
+from mreye.channels import DEFAULT_CHANNELS, channel_roles, channel_rows, chunk_size_for
+from mreye.fileformat import make_header, scale_counts
+from mreye.ringbuffer import ChunkRingBuffer
+from mreye.writer import ChunkWriter
+
 import numpy as np
 
-import threading
 import queue
+import threading
+import time
 
 class Interface:
+    """Acquires the analog channels, records them and plays rewards.
+
+    Parameters
+    ----------
+    output_path: str or Path
+        File the samples are recorded to
+    logger: logging.Logger
+    backend: Backend, optional
+        Defaults to a `NIDAQBackend`
+    channels: list of dict, optional
+        Acquired channels, see `mreye.channels`
+    sampling_rate: float, optional, default: 2000
+        Samples per second per channel
+    latency_budget: float, optional, default: 0.025
+        Longest time, in seconds, a sample may wait for the rest of its chunk;
+        sets the read chunk size
+    """
     reward_duration = 0.1
-    channels = {
-        'eyeh': 'Dev2/ai0',
-        'eyev': 'Dev2/ai1',
-        # 'TR': 'Dev2/port1/line0',
-        'TR': 'Dev2/ai2',
-        'reward': 'Dev2/ao0',
-    }
+    channels = DEFAULT_CHANNELS
+    reward_channel = 'Dev2/ao0'
     sampling_rate = 2000
-    read_chunk_size = 50
+    latency_budget = 0.025
+    # seconds of samples the consumer may fall behind by before chunks are lost
+    buffer_duration = 2.0
+    # store unscaled int16 counts instead of float64 volts
+    raw = False
+    # seconds between entries of the sample -> wall clock index
+    index_interval = 1.0
 
-    def __init__(self, output_path, logger):
+    def __init__(self, output_path, logger, backend=None, channels=None, sampling_rate=None, latency_budget=None):
         self.output_path = output_path
+        if channels is not None:
+            self.channels = channels
+        if sampling_rate is not None:
+            self.sampling_rate = sampling_rate
+        if latency_budget is not None:
+            self.latency_budget = latency_budget
+        self.analog_channels = [channel['name'] for channel in self.channels]
+        self.roles = channel_roles(self.channels)
+        self.rows = channel_rows(self.analog_channels, self.roles)
+        # samples already in output_path when a session is resumed
+        self.sample_offset = 0
+        self.read_chunk_size = chunk_size_for(self.sampling_rate, self.latency_budget)
+        self.buffer_chunks = max(int(np.ceil(self.buffer_duration * self.sampling_rate / self.read_chunk_size)), 2)
         self.logger = logger
+        if backend is None:
+            from mreye.daq import NIDAQBackend
+            backend = NIDAQBackend()
+        self.backend = backend
         data = np.ones(int(self.reward_duration*self.sampling_rate))
         self.reward_trace = np.append(5*data, -5*data)
-        self.queues = {}
         self.threads = {}
+        self.reward_requests = queue.Queue()
+        self.buffer = ChunkRingBuffer((len(self.analog_channels), self.read_chunk_size), capacity=self.buffer_chunks)
 
-    def init_analog_inputs(self, task):
-        task.ai_channels.add_ai_voltage_chan(self.channels['eyeh'])
-        task.ai_channels.add_ai_voltage_chan(self.channels['eyev'])
-        task.ai_channels.add_ai_voltage_chan(self.channels['TR'])
-        
-        task.timing.cfg_samp_clk_timing(
-            rate=self.sampling_rate, 
-            sample_mode=nidaqmx.constants.AcquisitionType.CONTINUOUS,
-            samps_per_chan=self.read_chunk_size
+    def header(self, scales, start_time):
+        return make_header(
+            self.analog_channels, self.sampling_rate, np.int16 if self.raw else np.float64,
+            scales=scales, start_time=start_time, chunk_size=self.read_chunk_size,
+            roles=self.roles,
         )
-        reader = AnalogMultiChannelReader(task.in_stream)
-        return reader
-
-    def init_outputs(self):
-        task = nidaqmx.Task()
-        task.ao_channels.add_ao_voltage_chan(self.channels['reward'])
-
-        task.timing.cfg_samp_clk_timing(
-            rate=self.sampling_rate, 
-            sample_mode=nidaqmx.constants.AcquisitionType.FINITE,
-            samps_per_chan=int(self.reward_duration*self.sampling_rate*2)
-        )
-        writer = AnalogSingleChannelWriter(task.out_stream, auto_start=True)
-        return task, writer
 
     def start(self):
+        """Open the backend and start the acquisition and reward threads.
+
+        The backend is set up before the threads start, so a missing driver or
+        a misconfigured device raises here.
+        """
+        with startup.timed('daq_configure'):
+            self.scales = self.backend.open(self)
+        self.clock_started = time.perf_counter()
+        try:
+            self.backend.prepare_reward(self, self.reward_trace)
+        except Exception:
+            self.backend.close()
+            raise
         self.running = True
 
-        self.queues["input"] = queue.Queue()
-        self.queues["output"] = queue.Queue()
+        self.writer = ChunkWriter(
+            self.output_path, (self.read_chunk_size, len(self.analog_channels)),
+            dtype=np.int16 if self.raw else np.float64, logger=self.logger,
+        )
         self.threads["acquire"] = threading.Thread(target=self.acquire, name="acquire", daemon=True)
         self.threads["acquire"].start()
-        # self.logger.info("Started acquisition thread.")
-        # self.threads["write"] = threading.Thread(target=self.write, name="write", daemon=True)
-        # self.threads["write"].start()
-        # self.logger.info("Started write thread.")
+        self.threads["reward"] = threading.Thread(target=self.reward_loop, name="reward", daemon=True)
+        self.threads["reward"].start()
 
     def acquire(self):
-        with (nidaqmx.Task() as readAnalogTask, 
-            #   nidaqmx.Task() as readDigitalTask,
-            open(self.output_path, 'ab') as output_file):
-            analogReader = self.init_analog_inputs(readAnalogTask)
-            # digitalReader = self.init_digital_inputs(readDigitalTask)
-            analogData = np.zeros((3, self.read_chunk_size), dtype=np.float64)
-            # digitalData = np.zeros(self.read_chunk_size, dtype=np.float64)
+        scales = self.scales
+        if self.raw:
+            rawData = np.zeros((len(self.analog_channels), self.read_chunk_size), dtype=np.int16)
+        start_time = time.time()
+        self.writer.start(self.header(scales, start_time))
+        self.writer.mark(self.sample_offset, start_time)
+        index_samples = int(self.index_interval * self.sampling_rate)
+        samples = 0
+        next_mark = index_samples
 
+        try:
             while self.running:
-                analogReader.read_many_sample(analogData, 
-                    number_of_samples_per_channel=self.read_chunk_size)
-                # digitalReader.read_many_sample(digitalData, number_of_samples_per_channel=self.read_chunk_size)
-                analogData.tofile(output_file)
-                self.queues["input"].put(analogData)
-    
-    def write(self):
-        with nidaqmx.Task() as writeTask:
-            writer = self.init_outputs(writeTask)
-            while self.running:
-                wave = self.queues["output"].get()
-                writer.write_many_sample(wave)
+                # an unpaced backend would otherwise overwrite chunks before they are read
+                if not self.backend.paced and not self.buffer.wait_writable(timeout=0.1):
+                    continue
+                analogData = self.buffer.writable()
+                if self.raw:
+                    self.backend.read(rawData)
+                    self.writer.write(rawData.T)
+                    scale_counts(rawData, scales, out=analogData)
+                else:
+                    self.backend.read(analogData)
+                    self.writer.write(analogData.T)
+                self.buffer.commit()
+                if samples == 0:
+                    startup.record('first_sample', time.perf_counter() - self.clock_started)
+                samples += self.read_chunk_size
+                if samples >= next_mark:
+                    self.writer.mark(self.sample_offset + samples, time.time())
+                    next_mark += index_samples
+        except Exception as e:
+            self.logger.exception("Acquisition failed")
+            # the consumer would otherwise wait for the next chunk forever
+            self.buffer.fail(e)
+        finally:
+            self.backend.close()
+
+    def sync(self):
+        self.writer.sync()
 
     def stop(self):
         self.running = False
+        self.reward_requests.put(None)
         for thread in self.threads.values():
             thread.join()
+        self.writer.stop()
 
     def good_monkey(self, blocking=False):
-        self.threads['reward'] = threading.Thread(target=self.reward, name="reward", daemon=True)
-        self.threads['reward'].start()
+        """Queue a reward; requests that arrive while one is pending are merged."""
+        done = threading.Event() if blocking else None
+        self.reward_requests.put((time.perf_counter(), done))
         if blocking:
-            self.threads.pop('reward').join()
+            done.wait()
 
-    def reward(self):
-        task, writer = self.init_outputs()
-        writer.write_many_sample(self.reward_trace)
-        task.wait_until_done()
-        task.stop()
-        task.close()
\ No newline at end of file
+    def reward_loop(self):
+        try:
+            while True:
+                request = self.reward_requests.get()
+                if request is None:
+                    return
+                requests = [request]
+                while True:
+                    try:
+                        request = self.reward_requests.get_nowait()
+                    except queue.Empty:
+                        break
+                    if request is None:
+                        self.reward_requests.put(None)
+                        break
+                    requests.append(request)
+                try:
+                    started = self.backend.reward()
+                except Exception:
+                    self.logger.exception("Reward failed")
+                else:
+                    self.logger.info("Reward latency {:.2f} ms{}".format(
+                        (started - requests[0][0]) * 1e3,
+                        " ({} requests merged)".format(len(requests)) if len(requests) > 1 else "",
+                    ))
+                for _, done in requests:
+                    if done is not None:
+                        done.set()
+        finally:
+            self.backend.close_reward()
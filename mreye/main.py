@@ -1,126 +1,416 @@
-from mreye.display import Display
-from mreye.getLogger import getLogger
+from mreye import startup
+from mreye.calibration import CalibrationRun, save_calibration
+from mreye.display import Display, screen_geometry
+from mreye.display_process import DisplayProcess
+from mreye.events import EventRecorder
+from mreye.gaze import GazeProcessor
+from mreye.getLogger import getLogger, stop_logging
 from mreye.interface import Interface
+from mreye.multiwindow_display import MultiWindowDisplay
+from mreye.recover import recover_session
+from mreye.render_backend import OffscreenBackend
+from mreye.sequence import compile_sequence
+from mreye.session import Session
+from mreye.triggers import EdgeDetector
 
 import json
 from pathlib import Path
 import time
 import threading
 
+import numpy as np
+
 ANALOG_THRESHOLD = 2
+# half width of the trigger hysteresis band, in volts
+TRIGGER_HYSTERESIS = 0.5
+# minimum duration of a trigger level, in seconds
+TRIGGER_DEBOUNCE = 0.001
+# minimum seconds between repeats of a warning, e.g. dropped frames
+LOG_RATE_LIMIT = 1.0
+
+startup.record('import', startup.since_import())
+
+def fixated_samples(gaze, fixation, start=None, stop=None):
+    """Number of samples of `gaze` inside the `fixation` window, and of samples that are not blinks."""
+    x, y = gaze.x[start:stop], gaze.y[start:stop]
+    valid = ~gaze.blink[start:stop]
+    inside = (x - fixation['x'])**2 + (y - fixation['y'])**2 <= fixation['radius']**2
+    return int((inside & valid & ~gaze.saccade[start:stop]).sum()), int(valid.sum())
+
 class Experiment:
     eye_calibration = {
         'gain': {'x': 10, 'y': 10},
         'offset': {'x': 0, 'y': 0},
     }
-    def __init__(self, sequence, session_name, verbose=False):
-        # set up data paths
+    def __init__(self, sequence, session_name, verbose=False, backend=None, display_process=False, eye_calibration=None,
+                 headless=False, interface_args=None, resume=False, experimenter_rect=None, mouse_callback=None):
         if session_name is None:
             session_name = time.strftime("%Y%m%d_%H%M%S")
-        self.session_dir = session_dir = Path(session_name).mkdir()
+        self.session_dir = session_dir = Path(session_name)
+        if resume:
+            # cut the torn ends of the interrupted run's files before appending to them
+            recovery = recover_session(session_dir)
+            session = Session(session_dir)
+            if sequence is None:
+                sequence = session.sequence
+
+        # validate the sequence and probe its stimuli before anything is written
+        display_args = ([1920,0,1920,1080], 119, 38.4)
+        blocks, manifest = compile_sequence(sequence, screen_geometry(*display_args))
+
+        # set up data paths
+        session_dir.mkdir(exist_ok=resume)
         self.analog_data_path = session_dir/'analog_data.bin'
         self.logger_path = session_dir/'experiment.log'
-        self.data_path = session_dir/'data.txt'
-        json.dump(sequence, open(session_dir/"sequence.json",'w'))
+        self.events_path = session_dir/'events.jsonl'
+        self.calibration_path = session_dir/'calibration.json'
+        if not resume:
+            json.dump(sequence, open(session_dir/"sequence.json",'w'))
 
-        # set up main logger
-        self.logger=getLogger('main', printLevel='DEBUG' if verbose else 'WARN', fileName=self.logger_path)
+        # set up loggers; all of them write to the session log from one background thread
+        log_args = dict(fileName=self.logger_path, queued=True, rate_limit=LOG_RATE_LIMIT)
+        self.logger=getLogger('main', printLevel='DEBUG' if verbose else 'WARN', **log_args)
         self.logger.info('Main logger initialized')
 
-        # set up display and interface
-        self.display = Display([1920,0,1920,1080], 119, 38.4, logger=getLogger(name='display', fileName=self.logger_path))
-        self.interface = Interface(self.analog_data_path, logger=getLogger(name='interface', fileName=self.logger_path))
-        self.sequence = sequence
+        # set up interface and display; a headless display logs a hash of every frame instead of showing it
+        self.interface = Interface(self.analog_data_path, logger=getLogger(name='interface', **log_args), backend=backend,
+                                   **(interface_args or {}))
+        # with an experimenter screen, the operator sees the gaze trace and fixation window
+        display_class = Display
+        # every run of a resumed session keeps its own frame timing; the first resume is run 2
+        timing_name = 'frame_timing.npy'
+        if resume:
+            timing_name = 'frame_timing_run{}.npy'.format(len(session.get_events('RESUME')) + 2)
+        display_kwargs = dict(timing_path=session_dir/timing_name)
+        process_kwargs = {}
+        if experimenter_rect is not None:
+            display_class = MultiWindowDisplay
+            display_kwargs['experimenter_rect'] = list(experimenter_rect)
+            display_kwargs['sampling_rate'] = self.interface.sampling_rate
+            process_kwargs['gaze_capacity'] = max(Display.GAZE_CAPACITY,
+                                                  MultiWindowDisplay.trace_length(self.interface.sampling_rate))
+            if mouse_callback is not None:
+                if display_process:
+                    raise ValueError("A mouse callback needs the display in this process")
+                display_kwargs['mouse_callback'] = mouse_callback
+        if headless:
+            display_kwargs['render_backend'] = OffscreenBackend(hash_path=session_dir/'frame_hashes.txt', append=resume)
+        if display_process:
+            self.display = DisplayProcess(display_class, *display_args, logger_args=dict(name='display', **log_args),
+                                          **process_kwargs, **display_kwargs)
+        else:
+            self.display = display_class(*display_args, logger=getLogger(name='display', **log_args), **display_kwargs)
+        self.recorder = EventRecorder(self.events_path, self.interface.sampling_rate, logger=self.logger)
+        self.display.set_manifest(manifest)
+        self.sequence = blocks
+        self.block_index = -1
+        self.resumed = None
+        # an error that stopped the experiment, raised again by `run`
+        self.error = None
+        if eye_calibration is not None:
+            self.eye_calibration = eye_calibration
+            self.save_calibration(eye_calibration)
+        if resume:
+            self.resume_from(session, recovery, keep_calibration=eye_calibration is not None)
         self.logger.info("Experiment initialized.")
 
+    def resume_from(self, session, recovery, keep_calibration=False):
+        """Continue the interrupted `session` from the block that was running at its last checkpoint.
+
+        New samples are appended to the recorded ones, and that block is
+        started again from its beginning.
+        """
+        header = session.header
+        expected = {
+            'channels': self.interface.analog_channels,
+            'sampling_rate': self.interface.sampling_rate,
+            'dtype': np.dtype(np.int16 if self.interface.raw else np.float64).str,
+            'chunk_size': self.interface.read_chunk_size,
+        }
+        mismatched = [key for key, value in expected.items() if header.get(key) != value]
+        if mismatched:
+            raise ValueError("Cannot resume {}: acquisition settings differ in {}".format(
+                session, ', '.join(mismatched)))
+        checkpoint = session.checkpoint
+        first_block = checkpoint['block'] if checkpoint is not None else 0
+        if first_block >= len(self.sequence):
+            raise ValueError("Cannot resume {}: no blocks left to run".format(session))
+        if checkpoint is not None and not keep_calibration:
+            self.eye_calibration = checkpoint['calibration']
+        try:
+            start_time = session.start_time
+        except ValueError:
+            start_time = None
+        self.sequence = self.sequence[first_block:]
+        self.block_index = first_block - 1
+        self.interface.sample_offset = recovery.get('samples', 0)
+        self.resumed = {'start_time': start_time, 'block': first_block}
+        self.logger.info("Resuming at block {} ({}) after {} samples; recovery: {}".format(
+            first_block, self.sequence[0]['name'], self.interface.sample_offset, recovery))
+
     def run(self):
-        self.interface.start()
-        mainthread = threading.Thread(target=self.main, name="main")
-        mainthread.start()
-        self.display.start()
-        mainthread.join()
-
-    def log_event(self, event):
-        with open(self.data_path, 'a') as f:
-            f.write(event + '\n')
-    
+        try:
+            self.interface.start()
+        except Exception:
+            self.logger.exception("Could not start acquisition")
+            stop_logging()
+            raise
+        if isinstance(self.display, DisplayProcess):
+            self.display.start()
+            self.main()
+            self.display.join()
+        else:
+            mainthread = threading.Thread(target=self.main, name="main")
+            mainthread.start()
+            self.display.start()
+            mainthread.join()
+        stop_logging()
+        if self.error is not None:
+            raise self.error
+
+    def log_event(self, name, *args, sample=None):
+        self.recorder.record(name, *args, sample=sample)
+
     def main(self):
+        chunk_size = self.interface.read_chunk_size
+        try:
+            self.begin()
+            while self.running:
+                seq, analogdata, lost = self.interface.buffer.read()
+                if seq == 0:
+                    self.logger.info("Startup timing: {}; first chunk {:.1f} ms after import".format(
+                        startup.report(), startup.since_import() * 1e3))
+                if lost:
+                    self.logger.warning("Consumer fell behind by {} samples".format(lost))
+                self.process_chunk(analogdata, self.interface.sample_offset + seq*chunk_size)
+                # the chunk is a view into the ring, so the producer may have reused it meanwhile
+                if not self.interface.buffer.is_valid(seq):
+                    self.logger.warning("Chunk {} was overwritten while it was processed".format(seq))
+        except Exception as e:
+            self.logger.exception("Experiment stopped by an error")
+            self.error = e
+        finally:
+            # close the display even after an error, so run returns
+            self.display.post_update(['QUIT'])
+            self.interface.stop()
+            self.recorder.stop()
+
+    def begin(self):
         self.logger.info("Experiment started.")
 
-        self.start_time = time.time()
-        self.start_block()
-        total_samples = fixated_samples = 0
-        TRs = 0
-        TR_HIGH = True
-        # TOTAL_TR_NUMBER = 0
-        while True:
-            analogdata = self.interface.queues["input"].get()
-
-            # detect fixation
-            if 'fixation' in self.current_block:
-                eye_h = ((analogdata[0]+self.eye_calibration['offset']['x'])) * self.eye_calibration['gain']['x']
-                eye_v = ((analogdata[1]+self.eye_calibration['offset']['y'])) * self.eye_calibration['gain']['y']
-
-
-
-                eye_h -= self.current_block['fixation']['x']
-                eye_v -= self.current_block['fixation']['y']
-                distance = (eye_h**2 + eye_v**2)**0.5
-                fixated_samples += (distance <= self.current_block['fixation']['radius']).sum()
-                total_samples += analogdata.shape[1]
-                # self.logger.info((eye_h.min(), eye_v.min()))
-                # self.logger.debug("{}/{} samples fixated".format(fixated_samples, total_samples))
-
-            # detect trigger state changes
-            digital_data = analogdata[2]
-            if TR_HIGH and (digital_data<ANALOG_THRESHOLD).any():
-                self.logger.debug(("TR LOW", digital_data.min(), digital_data.max()))
-                self.log_event("TR_LOW {}".format(time.time()-self.start_time))
-                TR_HIGH = False
-                TRs += 1
-
-                if 'fixation' in self.current_block and fixated_samples/total_samples > self.current_block['fixation']['proportion']:
-                    prop_fix = fixated_samples/total_samples*100
-                    self.logger.info("Good monkey: {}%".format(prop_fix))
-                    self.log_event("REWARD {} {}".format(prop_fix, time.time()-self.start_time))
-                    self.interface.good_monkey()
-                total_samples = fixated_samples = 0
-            elif not TR_HIGH and (digital_data>ANALOG_THRESHOLD).any():
-                # self.logger.debug(("TR HIGH", digital_data.min(), digital_data.max()))
-                TR_HIGH = True
-                self.log_event("TR_HIGH {}".format(time.time()-self.start_time))
-
-            # check if block is finished and start next block
-            if TRs == self.current_block['n_triggers']:
-                TRs = 0
-                self.logger.debug("Block finished")
-                self.display.post_update(['CLEAR'])
-                if len(self.sequence) == 0:
-                    break
+        if self.resumed is None or self.resumed['start_time'] is None:
+            self.start_time = time.time()
+            self.recorder.start(self.start_time)
+            self.log_event("EXPERIMENT_START", self.start_time)
+        else:
+            # host times stay relative to the start of the interrupted run
+            self.start_time = self.resumed['start_time']
+            self.recorder.start(self.start_time)
+        if self.resumed is not None:
+            self.log_event("RESUME", self.resumed['block'], sample=self.interface.sample_offset)
+        self.reset()
+        self.running = True
+        self.preload_next_block()
+        # the first block starts at the first sample acquired by this run
+        self.start_block(self.interface.sample_offset)
+
+    def reset(self):
+        """Reset the trigger, gaze and fixation state, as at the start of acquisition."""
+        self.trigger = EdgeDetector(
+            ANALOG_THRESHOLD - TRIGGER_HYSTERESIS, ANALOG_THRESHOLD + TRIGGER_HYSTERESIS,
+            debounce=int(TRIGGER_DEBOUNCE * self.interface.sampling_rate),
+        )
+        self.gaze = GazeProcessor(self.interface.sampling_rate, self.eye_calibration)
+        self.total_samples = self.fixated_samples = 0
+        self.TRs = 0
+        self.calibration_run = None
+
+    def process_chunk(self, analogdata, start_sample):
+        """Process a chunk of samples, whose first sample is `start_sample`.
+
+        Trigger edges, calibration target onsets and the end of a calibration
+        are handled in the order of their samples. Each stretch of samples
+        between them is processed with the block and calibration current at
+        that point, so the events do not depend on where chunks are cut.
+        """
+        n = analogdata.shape[1]
+        samples, rising = self.trigger.process(analogdata[self.interface.rows['trigger']], start_sample)
+        # edges confirmed after the debounce period may lie in an earlier chunk
+        edges = [(min(max(sample - start_sample, 0), n), sample, is_rising)
+                 for sample, is_rising in zip(samples.tolist(), rising.tolist())]
+        pos = 0
+        i = 0
+        while self.running:
+            stop = edges[i][0] if i < len(edges) else n
+            if self.calibration_run is not None:
+                stop = min(stop, pos + self.calibration_run.until_next(start_sample + pos))
+            if stop > pos:
+                self.process_samples(analogdata[:, pos:stop], start_sample + pos)
+                pos = stop
+            if self.calibration_run is not None and self.calibration_run.remaining(start_sample + pos) <= 0:
+                self.finish_calibration()
+            elif i < len(edges) and edges[i][0] == pos:
+                _, sample, is_rising = edges[i]
+                i += 1
+                if is_rising:
+                    self.log_event("TR_HIGH", sample=sample)
                 else:
-                    self.start_block()
-        self.display.post_update(['QUIT'])
-        self.interface.stop()
+                    self.on_trigger(sample)
+            elif pos == n:
+                return
 
-    def start_block(self):
+    def process_samples(self, analogdata, start_sample):
+        """Process samples up to the next trigger edge or calibration event."""
+        rows = self.interface.rows
+        eye_h, eye_v = analogdata[rows['eye_h']], analogdata[rows['eye_v']]
+        if self.calibration_run is not None:
+            self.show_targets(self.calibration_run.add(eye_h, eye_v, start_sample))
+        gaze = self.gaze.process(eye_h, eye_v)
+        if self.display.gaze is not None:
+            self.display.gaze.write(gaze.x, gaze.y)
+        self.count_fixation(gaze, 0, len(gaze.x))
+
+    def count_fixation(self, gaze, start, stop):
+        """Count samples `start` to `stop` of `gaze` towards the fixation proportion.
+
+        Blinks are left out, and samples during saccades never count as fixated.
+        """
+        if 'fixation' not in self.current_block or stop <= start:
+            return
+        fixated, valid = fixated_samples(gaze, self.current_block['fixation'], start, stop)
+        self.fixated_samples += fixated
+        self.total_samples += valid
+
+    def on_trigger(self, sample):
+        self.logger.debug("TR LOW at sample %d", sample)
+        self.log_event("TR_LOW", sample=sample)
+        self.TRs += 1
+
+        fixation = self.current_block.get('fixation')
+        if fixation and self.total_samples and self.fixated_samples/self.total_samples > fixation['proportion']:
+            prop_fix = self.fixated_samples/self.total_samples*100
+            self.logger.info("Good monkey: {}%".format(prop_fix))
+            self.log_event("REWARD", prop_fix, sample=sample)
+            self.interface.good_monkey()
+        self.total_samples = self.fixated_samples = 0
+
+        # check if block is finished and start next block
+        if self.TRs == self.current_block.get('n_triggers'):
+            self.TRs = 0
+            self.end_block(sample)
+        else:
+            self.checkpoint(sample)
+
+    def end_block(self, sample):
+        self.logger.debug("Block finished")
+        self.display.post_update(['CLEAR'])
+        if len(self.sequence) == 0:
+            # a checkpoint past the last block, so the finished session is not resumed
+            self.block_index += 1
+            self.checkpoint(sample)
+            self.running = False
+        else:
+            self.start_block(sample)
+
+    def checkpoint(self, sample):
+        """Record the state needed to resume the session; the record also carries `sample`."""
+        self.log_event("CHECKPOINT", {
+            'block': self.block_index, 'TRs': self.TRs, 'calibration': self.eye_calibration,
+        }, sample=sample)
+
+    def show_targets(self, onsets):
+        for sample, i in onsets:
+            self.display.post_update(['CLEAR', self.calibration_run.target(i)])
+            self.log_event("CALIBRATION_TARGET", i, *self.calibration_run.targets[i].tolist(), sample=sample)
+
+    def finish_calibration(self):
+        """Fit the calibration from the samples collected and start the next block."""
+        run = self.calibration_run
+        self.calibration_run = None
+        sample = run.start + run.n_samples
+        try:
+            calibration = run.fit()
+        except ValueError as e:
+            self.logger.error("Calibration failed, keeping the previous one: {}".format(e))
+        else:
+            self.logger.info("Calibration: {:.3f} deg rms error, {} of {} samples rejected".format(
+                calibration['rms_error'], calibration['rejected'], calibration['samples'] + calibration['rejected']))
+            self.log_event("CALIBRATION", calibration['rms_error'], sample=sample)
+            self.eye_calibration = calibration
+            self.save_calibration(calibration)
+            self.gaze = GazeProcessor(self.interface.sampling_rate, calibration)
+        self.TRs = 0
+        self.total_samples = self.fixated_samples = 0
+        self.end_block(sample)
+
+    def save_calibration(self, calibration):
+        save_calibration(calibration, self.calibration_path)
+
+    def start_block(self, sample=None):
         self.current_block = self.sequence.pop(0)
+        self.block_index += 1
         self.logger.info("Starting block: {}".format(self.current_block['name']))
-        self.log_event("BLOCK_START {} {}".format(self.current_block['name'], time.time()-self.start_time))
+        self.log_event("BLOCK_START", self.current_block['name'], self.block_index, sample=sample)
+        self.checkpoint(sample)
+        # make the previous block and the start of this one durable
+        self.interface.sync()
+        self.recorder.flush()
+        if self.current_block.get('type') == 'calibration':
+            self.calibration_run = CalibrationRun(self.current_block, self.interface.sampling_rate, start=sample)
+        else:
+            self.calibration_run = None
         stimuli = self.current_block.get("stimuli", [])
+        if 'fixation' in self.current_block:
+            stimuli = stimuli + [dict(self.current_block['fixation'], type='fixation_window')]
         if stimuli:
             self.display.post_update(stimuli)
+        self.preload_next_block()
+
+    def preload_next_block(self):
+        # give the display the whole of this block to open and buffer the next block's videos
+        if self.sequence:
+            paths = [stimulus['path'] for stimulus in self.sequence[0].get('stimuli', []) if stimulus['type'] == 'video']
+            if paths:
+                self.display.preload(paths)
 
 if __name__ == "__main__":
     from mreye.generate_sequence import generate_sequence
     import json
     import sys
 
-    session_name = sys.argv[1]
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    session_name = args[0]
+    resume = '--resume' in sys.argv
 
-    if len(sys.argv) > 2:
-        sequence = json.load(open(sys.argv[2]))
+    if len(args) > 1:
+        sequence = json.load(open(args[1]))
+    elif resume:
+        # the sequence saved with the session
+        sequence = None
     else:
         sequence = generate_sequence()
 
-    experiment = Experiment(sequence, session_name, verbose=True)
+    display_process = '--display-process' in sys.argv
+    headless = '--headless' in sys.argv
+    options = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    if 'calibration' in options:
+        from mreye.calibration import load_calibration
+        eye_calibration = load_calibration(options['calibration'])
+    else:
+        eye_calibration = None
+    if 'experimenter' in options:
+        experimenter_rect = [int(value) for value in options['experimenter'].split(',')]
+    elif '--experimenter' in sys.argv:
+        experimenter_rect = MultiWindowDisplay.DEFAULT_EXPERIMENTER_RECT
+    else:
+        experimenter_rect = None
+    if '--simulate' in sys.argv:
+        from mreye.simulation import SimulatedBackend
+        backend = SimulatedBackend()
+    else:
+        backend = None
+
+    experiment = Experiment(sequence, session_name, verbose=True, backend=backend, display_process=display_process,
+                            eye_calibration=eye_calibration, headless=headless,
+                            resume=resume, experimenter_rect=experimenter_rect)
     experiment.run()
\ No newline at end of file
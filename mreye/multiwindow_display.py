@@ -1,57 +1,95 @@
+from mreye import startup
 from mreye.display import Display
+from mreye.gazebuffer import GazeRingBuffer
+from mreye.interface import Interface
 
-import time
-
-import cv2
+import numpy as np
 
 
 class MultiWindowDisplay(Display):
     EXPERIMENTER_SCREEN_NAME = 'EXPERIMENTER_SCREEN'
     DEFAULT_EXPERIMENTER_RECT = [0, 0, 888, 500]
     EYE_COLOR = (0, 0, 255)
-    def __init__(self, subject_rect, distance, diagonal_size, experimenter_rect=None, logger=None, mouse_callback=None):
-        super().__init__(subject_rect, distance, diagonal_size, logger)
+    FIXATION_WINDOW_COLOR = (0, 255, 0)
+    # milliseconds of the most recent gaze drawn as the trace
+    TRACE_DURATION = 500
+    def __init__(self, subject_rect, distance, diagonal_size, experimenter_rect=None, logger=None, mouse_callback=None, frame_cache=None, timing_path=None, trace_duration=None, sampling_rate=None, render_backend=None):
+        super().__init__(subject_rect, distance, diagonal_size, logger, frame_cache=frame_cache, timing_path=timing_path,
+                         render_backend=render_backend)
         self.experimenter_screen_name = self.EXPERIMENTER_SCREEN_NAME
         self.experimenter_rect = experimenter_rect if experimenter_rect is not None else self.DEFAULT_EXPERIMENTER_RECT
         X, Y, W, H = self.experimenter_rect
         self.show_eye = True
+        self.trace_samples = self.trace_length(sampling_rate, trace_duration)
+        if self.trace_samples > self.gaze.capacity:
+            self.gaze = GazeRingBuffer(self.trace_samples)
         self.experimenter_center = (W//2, H//2)
-        if W != self.W or H != self.H:
-            self.rescale_experimenter = True
-            pixels_diagonal = (self.W**2 + self.H**2)**0.5
-            experimenter_pixels_diagonal = (W**2 + H**2)**0.5
-            self.experimenter_pixels_per_degree = self.pixels_per_degree * experimenter_pixels_diagonal / pixels_diagonal 
+        self.rescale_experimenter = W != self.W or H != self.H
+        pixels_diagonal = (self.W**2 + self.H**2)**0.5
+        experimenter_pixels_diagonal = (W**2 + H**2)**0.5
+        self.experimenter_pixels_per_degree = self.pixels_per_degree * experimenter_pixels_diagonal / pixels_diagonal
         self.mouse_callback = mouse_callback
 
+    @classmethod
+    def trace_length(cls, sampling_rate=None, trace_duration=None):
+        """Number of gaze samples in a trace of `trace_duration` ms at `sampling_rate`.
+
+        The defaults are `TRACE_DURATION` and `Interface.sampling_rate`.
+        """
+        if sampling_rate is None:
+            sampling_rate = Interface.sampling_rate
+        if trace_duration is None:
+            trace_duration = cls.TRACE_DURATION
+        return max(int(round(trace_duration / 1000 * sampling_rate)), 1)
+
     def start(self):
-        cv2.namedWindow(self.experimenter_screen_name, cv2.WINDOW_NORMAL)
-        X, Y, W, H = self.experimenter_rect
-        cv2.moveWindow(self.experimenter_screen_name, X, Y)
-        cv2.resizeWindow(self.experimenter_screen_name, W, H)
+        with startup.timed('window'):
+            self.render_backend.open(self.experimenter_screen_name, tuple(self.experimenter_rect))
         if self.mouse_callback is not None:
-            cv2.setMouseCallback(self.experimenter_screen_name, self.mouse_callback)
+            self.render_backend.set_mouse_callback(self.experimenter_screen_name, self.mouse_callback)
         super().start()
 
+    def to_experimenter_pixels(self, x, y):
+        points = np.empty((len(x), 2), dtype=np.int32)
+        # keep far off-screen samples (e.g. blinks) within what cv2 can draw
+        limit = 4 * max(self.experimenter_rect[2], self.experimenter_rect[3])
+        np.clip(np.rint(x * self.experimenter_pixels_per_degree + self.experimenter_center[0]), -limit, limit, out=points[:, 0], casting='unsafe')
+        np.clip(np.rint(y * self.experimenter_pixels_per_degree + self.experimenter_center[1]), -limit, limit, out=points[:, 1], casting='unsafe')
+        return points
+
     def draw_eye(self, frame):
-        # eye_h, eye_v = self.update_queue.get()
-        eye_h = eye_h * self.experimenter_pixels_per_degree + self.experimenter_center[0]
-        eye_v = eye_v * self.experimenter_pixels_per_degree + self.experimenter_center[1]
-        for h, v in zip(eye_h, eye_v):
-            cv2.line(frame, h, v, self.EYE_COLOR, 2)
-        cv2.circle(frame, (h, v), 5, self.EYE_COLOR, -1)
-        return frame
+        import cv2
+        if self.fixation_window is not None:
+            center = self.to_experimenter_pixels(np.array([self.fixation_window['x']]), np.array([self.fixation_window['y']]))[0]
+            radius = int(round(self.fixation_window['radius'] * self.experimenter_pixels_per_degree))
+            cv2.circle(frame, tuple(int(c) for c in center), radius, self.FIXATION_WINDOW_COLOR, 1)
 
-    def render_frame(self, delta_t):
-        frame = self.get_frame(delta_t)
+        eye_h, eye_v = self.gaze.latest(self.trace_samples)
+        if len(eye_h) == 0:
+            return frame
+        points = self.to_experimenter_pixels(eye_h, eye_v)
+        # decimate to the screen: drop samples that land on the same pixel as
+        # the previous one, then cap the vertex count at the screen width
+        keep = np.ones(len(points), dtype=bool)
+        keep[1:] = (points[1:] != points[:-1]).any(axis=1)
+        points = points[keep]
+        step = -(-len(points) // self.experimenter_rect[2])
+        if step > 1:
+            points = np.concatenate((points[:-1:step], points[-1:]))
+        cv2.polylines(frame, [points.reshape(-1, 1, 2)], False, self.EYE_COLOR, 2)
+        cv2.circle(frame, (int(points[-1, 0]), int(points[-1, 1])), 5, self.EYE_COLOR, -1)
+        return frame
 
+    def present(self, frame):
+        import cv2
         if self.rescale_experimenter:
             exp_frame = cv2.resize(frame, (self.experimenter_rect[2], self.experimenter_rect[3]), interpolation=cv2.INTER_LINEAR)
         else:
-            exp_frame = frame
+            # the compositor reuses its frame, so never draw onto it
+            exp_frame = frame.copy()
         if self.show_eye:
             exp_frame = self.draw_eye(exp_frame)
 
-        cv2.imshow(self.subject_screen_name, frame)
-        cv2.imshow(self.experimenter_screen_name, exp_frame)
-        cv2.waitKey(1)
-        self.last_frame_time = time.time()
\ No newline at end of file
+        self.render_backend.show(self.subject_screen_name, frame)
+        self.render_backend.show(self.experimenter_screen_name, exp_frame)
+        self.render_backend.poll()
\ No newline at end of file
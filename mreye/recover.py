@@ -0,0 +1,173 @@
+from mreye.fileformat import INDEX_DTYPE, index_path, read_header
+from mreye.render_backend import parse_hash_line
+from mreye.session import LEGACY_CHANNELS, LEGACY_CHUNK_SIZE
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+def truncate_data(path):
+    """Cut a data file back to its last complete chunk.
+
+    Returns
+    -------
+    n_samples: int
+        Samples left in the file
+    removed: int
+        Bytes removed
+    """
+    header = read_header(path)
+    if header is None:
+        data_offset, itemsize = 0, np.dtype(np.float64).itemsize
+        n_channels, chunk_size = len(LEGACY_CHANNELS), LEGACY_CHUNK_SIZE
+    else:
+        data_offset, itemsize = header['data_offset'], np.dtype(header['dtype']).itemsize
+        n_channels, chunk_size = len(header['channels']), header.get('chunk_size') or 1
+    sample_nbytes = n_channels * itemsize
+    chunk_nbytes = chunk_size * sample_nbytes
+    size = os.path.getsize(path)
+    keep = max(size - data_offset, 0) // chunk_nbytes * chunk_nbytes
+    if data_offset + keep < size:
+        os.truncate(path, data_offset + keep)
+    return keep // sample_nbytes, size - data_offset - keep
+
+def truncate_lines(path, parse=None):
+    """Cut a text file back to its last complete line that `parse` accepts.
+
+    Returns
+    -------
+    removed: int
+        Bytes removed
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    keep = data.rfind(b'\n') + 1
+    if parse is not None:
+        # a crash can leave a line cut short but still followed by a newline
+        while keep:
+            start = data.rfind(b'\n', 0, keep - 1) + 1
+            line = data[start:keep].strip()
+            try:
+                if line:
+                    parse(line)
+                break
+            except ValueError:
+                keep = start
+    if keep < len(data):
+        os.truncate(path, keep)
+    return len(data) - keep
+
+def drop_events_after(path, n_samples):
+    """Cut an events.jsonl file back to before its first event at or after sample `n_samples`.
+
+    Returns
+    -------
+    dropped: int
+        Events removed
+    """
+    with open(path, 'rb') as f:
+        lines = f.readlines()
+    keep = 0
+    for i, line in enumerate(lines):
+        if line.strip() and json.loads(line).get('sample', -1) >= n_samples:
+            os.truncate(path, keep)
+            return sum(1 for line in lines[i:] if line.strip())
+        keep += len(line)
+    return 0
+
+def rebuild_index(path, n_samples, resumes=()):
+    """Drop index entries that are torn or point past the data.
+
+    If no entry survives, the index is rebuilt from the start time in the
+    header and the `resumes`, (sample, wall clock time) pairs at which
+    acquisition restarted.
+
+    Returns
+    -------
+    kept: int
+        Entries kept
+    dropped: int
+        Entries dropped
+    """
+    idx_path = index_path(path)
+    try:
+        size = os.path.getsize(idx_path)
+    except FileNotFoundError:
+        size = 0
+    n_entries = size // INDEX_DTYPE.itemsize
+    index = np.fromfile(idx_path, dtype=INDEX_DTYPE, count=n_entries) if n_entries else np.zeros(0, INDEX_DTYPE)
+    valid = ((index['sample'] >= 0) & (index['sample'] <= n_samples) & np.isfinite(index['time'])
+             & (index['time'] > 0))
+    # entries are appended in order, so the index ends at the first bad one
+    increasing = np.ones(len(index), dtype=bool)
+    increasing[1:] = (np.diff(index['sample']) >= 0) & (np.diff(index['time']) > 0)
+    good = valid & increasing
+    kept = int(np.argmin(good)) if not good.all() else len(index)
+    index = index[:kept]
+    if kept == 0:
+        header = read_header(path)
+        entries = list(resumes)
+        if header is not None and header.get('start_time') is not None:
+            entries.insert(0, (0, header['start_time']))
+        index = np.array(sorted(entries), dtype=INDEX_DTYPE)
+    if kept < n_entries or size % INDEX_DTYPE.itemsize or kept == 0:
+        tmp = idx_path.with_suffix('.idx.tmp')
+        index.tofile(tmp)
+        os.replace(tmp, idx_path)
+    return len(index), n_entries - kept
+
+def recover_session(path):
+    """Make the files of an interrupted session consistent, so it can be read or resumed.
+
+    The analog data is cut back to its last complete chunk, the event logs and
+    frame hash log to their last complete line and the events to those within
+    the data, and the sample index to its entries that lie within the data.
+    The analog data is only truncated, but the event logs and the index are
+    read in full, and the index is rewritten if entries are dropped, so
+    recovery time grows with their length. A session that ended cleanly is
+    left unchanged.
+
+    Parameters
+    ----------
+    path: str or Path
+        The session directory
+
+    Returns
+    -------
+    summary: dict
+        Samples kept and what was removed from each file
+    """
+    path = Path(path)
+    summary = {}
+    analog_data_path = path/'analog_data.bin'
+    if analog_data_path.exists():
+        summary['samples'], summary['data_bytes_removed'] = truncate_data(analog_data_path)
+    events_path = path/'events.jsonl'
+    resumes = []
+    if events_path.exists():
+        summary['event_bytes_removed'] = truncate_lines(events_path, json.loads)
+        if 'samples' in summary:
+            # events are flushed more often than the data, so they can refer to samples that were lost
+            summary['events_dropped'] = drop_events_after(events_path, summary['samples'])
+        with open(events_path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        start = next((record['args'][0] for record in records if record['name'] == 'EXPERIMENT_START'), None)
+        if start is not None:
+            resumes = [(record['sample'], start + record['host']) for record in records
+                       if record['name'] == 'RESUME' and 'sample' in record]
+    if (path/'data.txt').exists():
+        summary['data_txt_bytes_removed'] = truncate_lines(path/'data.txt')
+    if (path/'frame_hashes.txt').exists():
+        summary['frame_hash_bytes_removed'] = truncate_lines(path/'frame_hashes.txt', parse_hash_line)
+    if analog_data_path.exists():
+        summary['index_entries'], summary['index_entries_dropped'] = rebuild_index(
+            analog_data_path, summary['samples'], resumes)
+    return summary
+
+if __name__ == "__main__":
+    import sys
+
+    for session_path in sys.argv[1:]:
+        print("{}: {}".format(session_path, recover_session(session_path)))
@@ -0,0 +1,139 @@
+import hashlib
+import os
+import time
+
+import numpy as np
+
+def parse_hash_line(line):
+    """Return the (frame, time, digest) of a frame hash log line; raises ValueError if it is torn."""
+    fields = line.split()
+    if len(fields) != 3 or len(fields[2]) != 32:
+        raise ValueError("Incomplete frame hash line: {!r}".format(line))
+    return int(fields[0]), float(fields[1]), fields[2]
+
+class RenderBackend:
+    """Destination of the frames rendered by `Display`.
+
+    A backend is opened once per screen by the render thread, then `show` is
+    called with every frame and `poll` once per frame after all screens were
+    shown. Subclasses must implement `open` and `show`.
+    """
+    def open(self, name, rect):
+        """Prepare screen `name` at `rect` = (x, y, width, height)."""
+        raise NotImplementedError
+
+    def show(self, name, frame):
+        raise NotImplementedError
+
+    def poll(self):
+        pass
+
+    def set_mouse_callback(self, name, callback):
+        pass
+
+    def close(self):
+        pass
+
+class WindowBackend(RenderBackend):
+    """Shows frames in OpenCV windows."""
+    def open(self, name, rect):
+        import cv2
+        X, Y, W, H = rect
+        cv2.namedWindow(name, cv2.WINDOW_NORMAL)
+        cv2.moveWindow(name, X, Y)
+        cv2.resizeWindow(name, W, H)
+
+    def show(self, name, frame):
+        import cv2
+        cv2.imshow(name, frame)
+
+    def poll(self):
+        import cv2
+        cv2.waitKey(1)
+
+    def set_mouse_callback(self, name, callback):
+        import cv2
+        cv2.setMouseCallback(name, callback)
+
+    def close(self):
+        import cv2
+        cv2.destroyAllWindows()
+        cv2.waitKey(0)
+
+class OffscreenBackend(RenderBackend):
+    """Renders into preallocated buffers, without a window server.
+
+    The last frame of each screen is kept in `buffers`. The frames of one
+    screen, the subject screen unless `record` is given, can be written to a
+    video file and/or to a log with one line per frame holding the frame
+    number, its `time.perf_counter` time and a hash of its pixels, so a
+    session can be audited frame by frame afterwards.
+
+    Parameters
+    ----------
+    video_path: str or Path, optional
+        Video file the recorded frames are encoded to
+    hash_path: str or Path, optional
+        Text file the frame hashes are written to
+    record: str, optional, default: 'SUBJECT_SCREEN'
+        Name of the screen that is recorded
+    fps: float, optional, default: 60
+        Frame rate written to the video file
+    fourcc: str, optional, default: 'MJPG'
+        Codec of the video file
+    append: bool, optional, default: False
+        Continue an existing hash log, numbering frames on from its last
+        line, instead of replacing it
+    """
+    record = 'SUBJECT_SCREEN'
+    def __init__(self, video_path=None, hash_path=None, record=None, fps=60, fourcc='MJPG', append=False):
+        self.video_path = video_path
+        self.hash_path = hash_path
+        self.append = append
+        if record is not None:
+            self.record = record
+        self.fps = fps
+        self.fourcc = fourcc
+        self.buffers = {}
+        self.frames = 0
+        self.writer = None
+        self.hash_file = None
+
+    def open(self, name, rect):
+        X, Y, W, H = rect
+        self.buffers[name] = np.zeros((H, W, 3), dtype=np.uint8)
+        if name != self.record:
+            return
+        if self.video_path is not None:
+            import cv2
+            self.writer = cv2.VideoWriter(str(self.video_path), cv2.VideoWriter_fourcc(*self.fourcc), self.fps, (W, H))
+            if not self.writer.isOpened():
+                raise IOError("Could not open video for writing: {}".format(self.video_path))
+        if self.hash_path is not None:
+            if self.append and os.path.exists(self.hash_path):
+                with open(self.hash_path, 'rb') as f:
+                    lines = f.read().split(b'\n')
+                last = next((line for line in reversed(lines) if line.strip()), None)
+                if last is not None:
+                    self.frames = parse_hash_line(last)[0] + 1
+            self.hash_file = open(self.hash_path, 'a' if self.append else 'w')
+
+    def show(self, name, frame):
+        buffer = self.buffers[name]
+        np.copyto(buffer, frame)
+        if name != self.record:
+            return
+        if self.writer is not None:
+            self.writer.write(buffer)
+        if self.hash_file is not None:
+            digest = hashlib.blake2b(buffer, digest_size=16).hexdigest()
+            self.hash_file.write("{} {:.6f} {}\n".format(self.frames, time.perf_counter(), digest))
+        self.frames += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+        if self.hash_file is not None:
+            self.hash_file.close()
+            self.hash_file = None
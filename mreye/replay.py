@@ -0,0 +1,189 @@
+from mreye.channels import channel_rows
+from mreye.events import dump_event, event_record
+from mreye.getLogger import getLogger
+from mreye.main import Experiment
+from mreye.session import Session
+
+import copy
+import time
+
+class NullDisplay:
+    """Accepts display updates and discards them."""
+    gaze = None
+
+    def post_update(self, update):
+        pass
+
+    def preload(self, paths):
+        pass
+
+class EventCollector:
+    """Stands in for `EventRecorder`, keeping the event records in `records`."""
+    def __init__(self, sampling_rate):
+        self.sampling_rate = sampling_rate
+        self.records = []
+
+    def start(self, start_time):
+        self.start_time = start_time
+
+    def record(self, name, *args, sample=None):
+        self.records.append(event_record(name, args, sample, time.time() - self.start_time, self.sampling_rate))
+
+    def flush(self):
+        pass
+
+    def stop(self):
+        pass
+
+class ReplayInterface:
+    """Stands in for `Interface`, serving the samples of a recorded session.
+
+    Parameters
+    ----------
+    session: Session
+        The recorded session
+    read_chunk_size: int, optional, default: 2000
+        Number of samples handed to the experiment logic at a time. Edges are
+        located to the sample, so this only affects speed.
+    """
+    def __init__(self, session, read_chunk_size=2000):
+        self.session = session
+        self.sampling_rate = session.sampling_rate
+        self.read_chunk_size = read_chunk_size
+        self.sample_offset = 0
+        self.rows = channel_rows(session.channels, session.roles)
+        self.rewards = 0
+
+    def chunks(self, boundaries=()):
+        """Yield (start_sample, data) with data shaped (channels, samples).
+
+        No chunk crosses one of the sample indices in `boundaries`.
+        """
+        n_samples = self.session.n_samples
+        start = 0
+        for edge in sorted(set(b for b in boundaries if 0 < b < n_samples)) + [n_samples]:
+            for chunk_start in range(start, edge, self.read_chunk_size):
+                stop = min(chunk_start + self.read_chunk_size, edge)
+                yield chunk_start, self.session.samples(chunk_start, stop).T
+            start = edge
+
+    def sync(self):
+        pass
+
+    def good_monkey(self, blocking=False):
+        self.rewards += 1
+
+    def stop(self):
+        pass
+
+class Replay(Experiment):
+    """Runs the fixation, TR and reward logic of `Experiment` over a recorded session.
+
+    Nothing is displayed or acquired, and the events that would have been
+    logged are collected in `events` instead of written to events.jsonl.
+
+    Parameters
+    ----------
+    session: str, Path or Session
+        The recorded session
+    sequence: list of dict, optional
+        Sequence to replay, defaults to the session's sequence.json
+    fixation: dict, optional
+        Values overriding the `fixation` entry of every block that has one,
+        e.g. {'radius': 3, 'proportion': 0.7}
+    eye_calibration: dict, optional
+        Calibration to use, defaults to the session's calibration.json unless
+        the sequence fits its own, and to `Experiment.eye_calibration`
+        otherwise. Where the session was resumed, the calibration it resumed
+        with is used from then on unless this is given
+    read_chunk_size: int, optional, default: 2000
+        Number of samples processed at a time
+    logger: logging.Logger, optional
+    """
+    def __init__(self, session, sequence=None, fixation=None, eye_calibration=None,
+                 read_chunk_size=2000, logger=None):
+        if not isinstance(session, Session):
+            session = Session(session)
+        self.session = session
+        if sequence is None:
+            sequence = session.sequence
+        self.blocks = copy.deepcopy(sequence)
+        if fixation:
+            for block in self.blocks:
+                if 'fixation' in block:
+                    block['fixation'].update(fixation)
+        self.sequence = copy.deepcopy(self.blocks)
+        self.block_index = -1
+        self.resumed = None
+        self.keep_calibration = eye_calibration is not None
+        if eye_calibration is None and not any(block.get('type') == 'calibration' for block in self.sequence):
+            eye_calibration = session.calibration
+        if eye_calibration is not None:
+            self.eye_calibration = eye_calibration
+        if logger is None:
+            logger = getLogger('replay')
+        self.logger = logger
+        self.display = NullDisplay()
+        self.interface = ReplayInterface(session, read_chunk_size)
+        self.recorder = EventCollector(self.interface.sampling_rate)
+
+    def save_calibration(self, calibration):
+        pass
+
+    @property
+    def events(self):
+        """Event records, as they would appear in events.jsonl."""
+        return self.recorder.records
+
+    def restart(self, block_index, sample, calibration=None):
+        """Start block `block_index` again at `sample`, as the resumed `Experiment` did."""
+        if calibration is not None and not self.keep_calibration:
+            self.eye_calibration = calibration
+        self.sequence = copy.deepcopy(self.blocks[block_index:])
+        self.block_index = block_index - 1
+        self.log_event("RESUME", block_index, sample=sample)
+        self.reset()
+        self.running = True
+        self.start_block(sample)
+
+    def main(self):
+        self.begin()
+        # block and calibration each resumed run started with
+        resumes = {}
+        calibration = None
+        for event in self.session.events:
+            if event.name == 'CHECKPOINT':
+                calibration = event.args[0]['calibration']
+            elif event.name == 'RESUME':
+                resumes[event.sample] = (int(event.args[0]), calibration)
+        for start_sample, analogdata in self.interface.chunks(resumes):
+            if start_sample in resumes:
+                self.restart(resumes[start_sample][0], start_sample, resumes[start_sample][1])
+            self.process_chunk(analogdata, start_sample)
+            if not self.running:
+                break
+        if self.running:
+            self.logger.warning("{} ended before the sequence finished".format(self.session))
+        return self.events
+
+    run = main
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            for record in self.events:
+                f.write(dump_event(record) + '\n')
+
+if __name__ == "__main__":
+    import sys
+
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    options = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    fixation = {key: float(options[key]) for key in ('radius', 'proportion') if key in options}
+
+    replay = Replay(args[0], fixation=fixation)
+    replay.run()
+    if len(args) > 1:
+        replay.save(args[1])
+    else:
+        for record in replay.events:
+            print(dump_event(record))
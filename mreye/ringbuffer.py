@@ -0,0 +1,106 @@
+import queue
+import threading
+
+import numpy as np
+
+class ChunkRingBuffer:
+    """Fixed-capacity ring of preallocated chunks with one producer and one consumer.
+
+    The producer fills the array returned by `writable` in place and then calls
+    `commit`. The consumer calls `read`, which returns a view into the ring, so
+    no memory is allocated per chunk. If the consumer falls more than
+    `capacity - 1` chunks behind, the oldest chunks are skipped and the number
+    of lost samples is reported. If the producer fails, it passes its error to
+    `fail`, and `read` raises once the chunks committed before are read.
+
+    Parameters
+    ----------
+    chunk_shape: tuple
+        Shape of a single chunk, (channels, samples)
+    capacity: int, optional, default: 64
+        Number of chunks held by the ring
+    dtype: numpy dtype, optional, default: np.float64
+        Data type of the samples
+    """
+    def __init__(self, chunk_shape, capacity=64, dtype=np.float64):
+        self.capacity = capacity
+        self.chunk_shape = tuple(chunk_shape)
+        self.chunk_samples = self.chunk_shape[-1]
+        self.data = np.zeros((capacity,) + self.chunk_shape, dtype=dtype)
+        self.written = 0
+        self.read_seq = 0
+        self.lost_samples = 0
+        self.error = None
+        # True from `writable` until `commit`, while a slot is being filled
+        self.writing = False
+        self.condition = threading.Condition()
+
+    def writable(self):
+        """Return the slot the producer should fill next."""
+        self.writing = True
+        return self.data[self.written % self.capacity]
+
+    def wait_writable(self, timeout=None):
+        """Block until the next slot can be filled without losing a chunk the consumer has not read.
+
+        Returns
+        -------
+        ready: bool
+            False if `timeout` passed first
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.written - self.read_seq < self.capacity - 1, timeout)
+
+    def commit(self):
+        """Publish the slot returned by the last call to `writable`."""
+        with self.condition:
+            self.written += 1
+            self.writing = False
+            self.condition.notify()
+
+    def fail(self, error):
+        """Stop the consumer: `read` raises `error` once no chunk is left."""
+        with self.condition:
+            self.error = error
+            self.condition.notify()
+
+    def read(self, timeout=None):
+        """Return the next unread chunk.
+
+        Returns
+        -------
+        seq: int
+            Sequence number of the chunk; its first sample is `seq * chunk_samples`
+        chunk: np.ndarray
+            View into the ring, valid until the producer wraps around to it
+        lost: int
+            Number of samples skipped because the consumer fell behind
+
+        Raises
+        ------
+        queue.Empty
+            If no chunk arrived within `timeout`
+        RuntimeError
+            If the producer failed, see `fail`
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.written > self.read_seq or self.error is not None, timeout):
+                raise queue.Empty
+            if self.written <= self.read_seq:
+                raise RuntimeError("Acquisition failed: {!r}".format(self.error)) from self.error
+            lost = 0
+            # the producer may be writing into slot `written`, so stay one slot clear of it
+            oldest = self.written - (self.capacity - 1)
+            if self.read_seq < oldest:
+                lost = (oldest - self.read_seq) * self.chunk_samples
+                self.lost_samples += lost
+                self.read_seq = oldest
+            seq = self.read_seq
+            self.read_seq += 1
+            # wake a producer waiting for space
+            self.condition.notify_all()
+        return seq, self.data[seq % self.capacity], lost
+
+    def is_valid(self, seq):
+        """True if the producer has not started to overwrite the chunk `seq` since it was read."""
+        return self.written + self.writing - seq <= self.capacity
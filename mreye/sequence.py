@@ -0,0 +1,161 @@
+from mreye.framecache import fit_size
+
+import copy
+import os
+
+# keys every display object of a type must have
+REQUIRED_KEYS = {
+    'circle': ('x', 'y', 'r', 'c'),
+    'video': ('path', 'x', 'y'),
+    'cached_video': ('path', 'x', 'y'),
+}
+VIDEO_TYPES = ('video', 'cached_video')
+
+class SequenceError(ValueError):
+    """Raised with every problem found in a sequence at once."""
+    def __init__(self, problems):
+        self.problems = problems
+        super().__init__("Invalid sequence:\n" + "\n".join("  " + problem for problem in problems))
+
+def probe_video(path):
+    """Frame rate, frame count and size of the video at `path`."""
+    import cv2
+    cap = cv2.VideoCapture(str(path))
+    try:
+        if not cap.isOpened():
+            raise IOError("could not open video {}".format(path))
+        probe = {
+            'fps': cap.get(cv2.CAP_PROP_FPS),
+            'frame_count': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        }
+    finally:
+        cap.release()
+    if not probe['fps'] > 0:
+        raise IOError("video {} has no frame rate".format(path))
+    if probe['frame_count'] <= 0 or probe['width'] <= 0 or probe['height'] <= 0:
+        raise IOError("video {} has no frames".format(path))
+    return probe
+
+def block_problems(i, block):
+    """Problems with the structure of block `i`, apart from its stimuli."""
+    where = "block {} ({})".format(i, block.get('name', 'unnamed'))
+    problems = []
+    if 'name' not in block:
+        problems.append("{}: no name".format(where))
+    if block.get('type') == 'calibration':
+        targets = block.get('targets')
+        if not targets or any(len(target) != 2 for target in targets):
+            problems.append("{}: calibration targets must be a list of [x, y]".format(where))
+        if block.get('order', 1) not in (1, 2):
+            problems.append("{}: calibration order must be 1 or 2".format(where))
+        if not block.get('max_rms_error', 1) > 0:
+            problems.append("{}: calibration max_rms_error must be positive".format(where))
+    elif not isinstance(block.get('n_triggers'), int) or block['n_triggers'] <= 0:
+        problems.append("{}: n_triggers must be a positive integer".format(where))
+    fixation = block.get('fixation')
+    if fixation is not None:
+        missing = [key for key in ('x', 'y', 'radius', 'proportion') if key not in fixation]
+        if missing:
+            problems.append("{}: fixation is missing {}".format(where, ', '.join(missing)))
+        elif not 0 <= fixation['proportion'] <= 1:
+            problems.append("{}: fixation proportion must be between 0 and 1".format(where))
+    return problems
+
+def compile_sequence(sequence, geometry=None):
+    """Validate a sequence and resolve everything its blocks need ahead of the scan.
+
+    Every video is probed once. If `geometry` is given, each stimulus gets a
+    `pixel` entry with its position (and radius) on the subject screen, so
+    `Display` does not have to convert it when the block starts.
+
+    Parameters
+    ----------
+    sequence: list of dict
+        Blocks as produced by `generate_sequence`
+    geometry: tuple, optional
+        (pixels_per_degree, (width, height)) of the subject screen, see
+        `mreye.display.screen_geometry`
+
+    Returns
+    -------
+    blocks: list of dict
+        Validated copies of the blocks
+    manifest: dict
+        Resources used by the sequence: `videos` maps the path of every
+        video to its probe, and `cached_videos` lists the paths played from
+        the frame cache
+
+    Raises
+    ------
+    SequenceError
+        Listing every problem found
+    """
+    blocks = copy.deepcopy(sequence)
+    problems = []
+    probes = {}
+    cached = []
+    for i, block in enumerate(blocks):
+        problems += block_problems(i, block)
+        where = "block {} ({})".format(i, block.get('name', 'unnamed'))
+        for j, stimulus in enumerate(block.get('stimuli', [])):
+            kind = stimulus.get('type')
+            if kind not in REQUIRED_KEYS:
+                problems.append("{}, stimulus {}: unknown type {!r}".format(where, j, kind))
+                continue
+            missing = [key for key in REQUIRED_KEYS[kind] if key not in stimulus]
+            if missing:
+                problems.append("{}, stimulus {}: missing {}".format(where, j, ', '.join(missing)))
+                continue
+            stimulus.setdefault('z', 0)
+            if kind in VIDEO_TYPES:
+                path = stimulus['path']
+                if path not in probes:
+                    try:
+                        if not os.path.exists(path):
+                            raise IOError("video {} does not exist".format(path))
+                        probes[path] = probe_video(path)
+                    except IOError as e:
+                        probes[path] = None
+                        problems.append("{}, stimulus {}: {}".format(where, j, e))
+                if probes[path] is None:
+                    continue
+                if kind == 'cached_video' and path not in cached:
+                    cached.append(path)
+            if geometry is not None:
+                stimulus['pixel'] = pixel_position(stimulus, geometry, probes.get(stimulus.get('path')))
+    if problems:
+        raise SequenceError(problems)
+    return blocks, {'videos': {path: probe for path, probe in probes.items()}, 'cached_videos': cached}
+
+def pixel_position(stimulus, geometry, probe=None):
+    """Screen position of `stimulus`, as `Display.add_object` computes it.
+
+    For videos this is the top left corner of their frames, whose size is
+    taken from `probe`.
+    """
+    pixels_per_degree, (width, height) = geometry
+    x = stimulus['x'] * pixels_per_degree + width // 2
+    y = stimulus['y'] * pixels_per_degree + height // 2
+    if stimulus['type'] == 'circle':
+        return {'x': int(x), 'y': int(y), 'r': int(stimulus['r'] * pixels_per_degree)}
+    frame_width, frame_height = probe['width'], probe['height']
+    if stimulus['type'] == 'cached_video':
+        frame_width, frame_height = fit_size(frame_width, frame_height, width, height)
+    return {'x': int(x - frame_width / 2), 'y': int(y - frame_height / 2)}
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    with open(sys.argv[1]) as f:
+        sequence = json.load(f)
+    try:
+        blocks, manifest = compile_sequence(sequence)
+    except SequenceError as e:
+        print(e)
+        sys.exit(1)
+    print("{} blocks, {} videos".format(len(blocks), len(manifest['videos'])))
+    for path, probe in manifest['videos'].items():
+        print("{}: {fps:.2f} fps, {frame_count} frames, {width}x{height}".format(path, **probe))
@@ -0,0 +1,270 @@
+from mreye.calibration import load_calibration
+from mreye.channels import LEGACY_ROLES
+from mreye.events import read_events
+from mreye.fileformat import read_header, read_index
+
+from collections import namedtuple
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+Event = namedtuple('Event', ['name', 'time', 'args', 'sample'])
+
+# layout of recordings made before analog_data.bin had a header
+LEGACY_CHANNELS = ['eyeh', 'eyev', 'TR']
+LEGACY_SAMPLING_RATE = 2000
+LEGACY_CHUNK_SIZE = 50
+
+def parse_event(line):
+    """Parse a line of data.txt.
+
+    Lines hold the event name, its arguments and `key=value` fields for the
+    sample index and host time. Legacy lines have no fields and end with the
+    host time.
+    """
+    tokens = line.split()
+    args = [token for token in tokens[1:] if '=' not in token]
+    fields = dict(token.split('=', 1) for token in tokens[1:] if '=' in token)
+    if 'host' not in fields:
+        return Event(tokens[0], float(args[-1]), args[:-1], None)
+    sample = int(fields['sample']) if 'sample' in fields else None
+    return Event(tokens[0], float(fields['host']), args, sample)
+
+class Session:
+    """Read-only access to a session directory written by `Experiment`.
+
+    The analog data is memory-mapped, so slicing a block or a TR only reads
+    the pages it touches. Events and the sequence are parsed on first use.
+
+    Parameters
+    ----------
+    path: str or Path
+        The session directory
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.analog_data_path = self.path/'analog_data.bin'
+        self.events_path = self.path/'events.jsonl'
+        self.data_path = self.path/'data.txt'
+        self.sequence_path = self.path/'sequence.json'
+        self.calibration_path = self.path/'calibration.json'
+        self._header = None
+        self._analog = None
+        self._index = None
+        self._events = None
+        self._sequence = None
+        self._calibration = None
+        self._blocks = None
+
+    def __repr__(self):
+        return "Session('{}')".format(self.path)
+
+    @property
+    def header(self):
+        if self._header is None:
+            header = read_header(self.analog_data_path)
+            if header is None:
+                header = {
+                    'channels': LEGACY_CHANNELS,
+                    'sampling_rate': LEGACY_SAMPLING_RATE,
+                    'dtype': np.dtype(np.float64).str,
+                    'layout': 'chunk_major',
+                    'chunk_size': LEGACY_CHUNK_SIZE,
+                    'scales': None,
+                    'start_time': None,
+                    'data_offset': 0,
+                }
+            self._header = header
+        return self._header
+
+    @property
+    def channels(self):
+        return self.header['channels']
+
+    @property
+    def roles(self):
+        """Map of channel name to role, see `mreye.channels`."""
+        return self.header.get('roles', LEGACY_ROLES)
+
+    def role_channel(self, role):
+        """Name of the channel with `role`."""
+        for name, channel_role in self.roles.items():
+            if channel_role == role:
+                return name
+        raise KeyError("{} has no channel with role {!r}".format(self, role))
+
+    @property
+    def sampling_rate(self):
+        return self.header['sampling_rate']
+
+    @property
+    def analog(self):
+        """Memory-mapped samples, shaped (samples, channels).
+
+        Legacy recordings are shaped (chunks, channels, chunk_size) instead.
+        """
+        if self._analog is None:
+            header = self.header
+            dtype = np.dtype(header['dtype'])
+            n_channels = len(header['channels'])
+            nbytes = os.path.getsize(self.analog_data_path) - header['data_offset']
+            if header['layout'] == 'sample_major':
+                shape = (nbytes // (n_channels * dtype.itemsize), n_channels)
+            else:
+                chunk_size = header['chunk_size']
+                shape = (nbytes // (n_channels * chunk_size * dtype.itemsize), n_channels, chunk_size)
+            if shape[0] == 0:
+                self._analog = np.zeros(shape, dtype=dtype)
+            else:
+                self._analog = np.memmap(self.analog_data_path, dtype=dtype, mode='r',
+                                         offset=header['data_offset'], shape=shape)
+        return self._analog
+
+    @property
+    def n_samples(self):
+        analog = self.analog
+        if self.header['layout'] == 'sample_major':
+            return analog.shape[0]
+        return analog.shape[0] * analog.shape[2]
+
+    def channel(self, name, start=None, stop=None, scaled=True):
+        """Samples of a single channel between `start` and `stop`.
+
+        For sample-major recordings stored as float this is a strided view of
+        the file. Raw int16 recordings are converted to volts unless `scaled` is
+        False, and legacy recordings are always copied.
+        """
+        c = self.channels.index(name)
+        if self.header['layout'] == 'sample_major':
+            data = self.analog[start:stop, c]
+        else:
+            data = self.analog[:, c, :].reshape(-1)[start:stop]
+        scales = self.header['scales']
+        if scaled and scales is not None:
+            data = np.polynomial.polynomial.polyval(data.astype(np.float64), scales[c])
+        return data
+
+    def samples(self, start=None, stop=None, scaled=True):
+        """All channels between `start` and `stop`, shaped (samples, channels).
+
+        This is a view of the file unless the recording is legacy or raw counts
+        are converted to volts.
+        """
+        if self.header['layout'] == 'sample_major' and (not scaled or self.header['scales'] is None):
+            return self.analog[start:stop]
+        return np.stack([self.channel(name, start, stop, scaled) for name in self.channels], axis=1)
+
+    @property
+    def index(self):
+        """Sparse (sample, time) index, including the first sample."""
+        if self._index is None:
+            self._index = read_index(self.analog_data_path)
+        return self._index
+
+    def time_to_sample(self, t):
+        """Convert wall clock time(s) to sample indices."""
+        index = self.index
+        if len(index) == 0:
+            raise ValueError("{} has no sample index".format(self.analog_data_path))
+        if len(index) == 1:
+            sample = index['sample'][0] + (np.asarray(t) - index['time'][0]) * self.sampling_rate
+        else:
+            sample = np.interp(t, index['time'], index['sample'])
+            # extrapolate past the last entry with the nominal rate
+            sample = np.where(np.asarray(t) > index['time'][-1],
+                index['sample'][-1] + (np.asarray(t) - index['time'][-1]) * self.sampling_rate, sample)
+        return np.round(sample).astype(np.int64)
+
+    @property
+    def events(self):
+        """Events from events.jsonl, or data.txt for older sessions, read on first access."""
+        if self._events is None:
+            if self.events_path.exists():
+                self._events = [Event(record['name'], record['host'], record['args'], record.get('sample'))
+                                for record in read_events(self.events_path)]
+            else:
+                with open(self.data_path) as f:
+                    self._events = [parse_event(line) for line in f if line.strip()]
+        return self._events
+
+    def get_events(self, name):
+        return [event for event in self.events if event.name == name]
+
+    @property
+    def start_time(self):
+        """Wall clock time that event times are relative to."""
+        starts = self.get_events('EXPERIMENT_START')
+        if not starts:
+            raise ValueError("{} has no EXPERIMENT_START event".format(self.path))
+        if starts[0].args:
+            return float(starts[0].args[0])
+        return starts[0].time
+
+    def event_samples(self, events):
+        """Sample index of each event, estimated from its host time if it has none."""
+        samples = np.array([-1 if event.sample is None else event.sample for event in events], dtype=np.int64)
+        missing = np.flatnonzero(samples < 0)
+        if len(missing):
+            samples[missing] = self.time_to_sample([self.start_time + events[i].time for i in missing])
+        return samples
+
+    @property
+    def sequence(self):
+        if self._sequence is None:
+            with open(self.sequence_path) as f:
+                self._sequence = json.load(f)
+        return self._sequence
+
+    @property
+    def calibration(self):
+        """The eye calibration saved with the session, or None."""
+        if self._calibration is None and self.calibration_path.exists():
+            self._calibration = load_calibration(self.calibration_path)
+        return self._calibration
+
+    @property
+    def checkpoint(self):
+        """The last checkpoint `Experiment` recorded, with the sample it was taken at, or None."""
+        checkpoints = self.get_events('CHECKPOINT')
+        if not checkpoints:
+            return None
+        return dict(checkpoints[-1].args[0], sample=checkpoints[-1].sample)
+
+    @property
+    def blocks(self):
+        """One dict per started block with its name, index in the sequence and sample range.
+
+        A block that was interrupted and resumed appears once per start.
+        """
+        if self._blocks is None:
+            starts = self.get_events('BLOCK_START')
+            samples = list(self.event_samples(starts)) + [self.n_samples]
+            # older sessions did not log the index, and were never resumed
+            self._blocks = [
+                {'index': int(event.args[1]) if len(event.args) > 1 else i, 'name': event.args[0],
+                 'time': event.time, 'start': int(samples[i]), 'stop': int(samples[i+1])}
+                for i, event in enumerate(starts)
+            ]
+        return self._blocks
+
+    def block(self, i, channel=None):
+        """Samples of block `i`, for one channel or all of them."""
+        block = self.blocks[i]
+        if channel is not None:
+            return self.channel(channel, block['start'], block['stop'])
+        return self.samples(block['start'], block['stop'])
+
+    @property
+    def tr_samples(self):
+        return self.event_samples(self.get_events('TR_LOW'))
+
+    def tr(self, i, channel=None):
+        """Samples from TR `i` up to the next TR (or the end of the recording)."""
+        samples = self.tr_samples
+        start = samples[i]
+        stop = samples[i+1] if i+1 < len(samples) else self.n_samples
+        if channel is not None:
+            return self.channel(channel, start, stop)
+        return self.samples(start, stop)
@@ -0,0 +1,171 @@
+from mreye.backend import Backend
+
+import time
+
+import numpy as np
+
+class SimulatedBackend(Backend):
+    """Generates eye traces and scanner triggers without any hardware.
+
+    The eye alternates between fixations and saccades, with additive noise and
+    occasional blinks, and the trigger channel drops low for `trigger_duration`
+    seconds every `TR` seconds. Samples follow an exact sample clock; with
+    `speed` set, chunks are released at `speed` times real time, otherwise as
+    fast as they are consumed, see `Backend.paced`.
+
+    Parameters
+    ----------
+    TR: float, optional, default: 2.0
+        Seconds between triggers
+    speed: float or None, optional, default: 1.0
+        Multiple of real time to pace reads at, None to not pace at all
+    seed: int, optional
+        Seed for the random number generator
+    gain: float, optional, default: 10
+        Degrees of visual angle per volt on the eye channels
+    fixation_probability: float, optional, default: 0.8
+        Probability that a fixation lands on the centre
+    spread: float, optional, default: 10
+        Standard deviation, in degrees, of fixations away from the centre
+    fixation_duration: float, optional, default: 0.4
+        Mean fixation duration in seconds
+    saccade_duration: float, optional, default: 0.04
+        Saccade duration in seconds
+    noise: float, optional, default: 0.01
+        Standard deviation of the eye channel noise in volts
+    blink_rate: float, optional, default: 0.2
+        Mean number of blinks per second
+    blink_duration: float, optional, default: 0.15
+        Blink duration in seconds
+    """
+    # roles of the channels that are generated; other channels stay at zero
+    channel_roles = ['eye_h', 'eye_v', 'trigger']
+    trigger_high = 5.0
+    trigger_low = 0.0
+    trigger_duration = 0.01
+    blink_level = -10.0
+    raw_scale = [0.0, 10.0 / 32768]
+
+    def __init__(self, TR=2.0, speed=1.0, seed=None, gain=10, fixation_probability=0.8, spread=10,
+                 fixation_duration=0.4, saccade_duration=0.04, noise=0.01, blink_rate=0.2, blink_duration=0.15):
+        self.TR = TR
+        self.speed = speed
+        self.rng = np.random.default_rng(seed)
+        self.gain = gain
+        self.fixation_probability = fixation_probability
+        self.spread = spread
+        self.fixation_duration = fixation_duration
+        self.saccade_duration = saccade_duration
+        self.noise = noise
+        self.blink_rate = blink_rate
+        self.blink_duration = blink_duration
+        # when set to (x, y) in degrees, the eye stays there
+        self.gaze = None
+        self.rewards = []
+
+    @property
+    def paced(self):
+        return bool(self.speed)
+
+    def open(self, interface):
+        self.logger = interface.logger
+        self.sampling_rate = interface.sampling_rate
+        self.raw = interface.raw
+        self.rows = [interface.rows[role] for role in self.channel_roles]
+        self.volts = np.zeros((len(interface.analog_channels), interface.read_chunk_size))
+        self.sample = 0
+        self.position = np.zeros(2)
+        self.target = np.zeros(2)
+        self.segment_end = 0
+        self.saccading = False
+        self.segment_start = 0
+        self.schedule_blink(0)
+        self.start_time = time.perf_counter()
+        return [self.raw_scale] * len(interface.analog_channels) if self.raw else None
+
+    def schedule_blink(self, after):
+        if self.blink_rate <= 0:
+            self.blink_start = self.blink_end = np.iinfo(np.int64).max
+            return
+        self.blink_start = after + int(self.rng.exponential(1 / self.blink_rate) * self.sampling_rate)
+        self.blink_end = self.blink_start + int(self.blink_duration * self.sampling_rate)
+
+    def next_segment(self):
+        """Switch between fixating and saccading to a new target."""
+        if self.saccading or self.gaze is not None:
+            self.position = self.target.copy()
+            self.saccading = False
+            duration = self.rng.exponential(self.fixation_duration)
+        else:
+            if self.rng.random() < self.fixation_probability:
+                self.target = np.zeros(2)
+            else:
+                self.target = self.rng.normal(0, self.spread, 2)
+            self.saccading = True
+            duration = self.saccade_duration
+        self.segment_end = self.segment_start + max(int(duration * self.sampling_rate), 1)
+
+    def eye_trace(self, n):
+        """Eye position in degrees, shaped (2, n)."""
+        eye = np.empty((2, n))
+        pos = 0
+        while pos < n:
+            if self.sample + pos >= self.segment_end:
+                self.segment_start = self.sample + pos
+                if self.gaze is not None:
+                    self.target = np.asarray(self.gaze, dtype=np.float64)
+                self.next_segment()
+            stop = min(n, self.segment_end - self.sample)
+            if self.saccading:
+                frac = (self.sample + np.arange(pos, stop) - self.segment_start) / (self.segment_end - self.segment_start)
+                eye[:, pos:stop] = self.position[:, None] + np.outer(self.target - self.position, frac)
+            else:
+                eye[:, pos:stop] = self.position[:, None]
+            pos = stop
+        return eye
+
+    def generate(self, out):
+        n = out.shape[1]
+        samples = self.sample + np.arange(n)
+        eye = self.eye_trace(n) / self.gain
+        eye += self.rng.normal(0, self.noise, eye.shape)
+
+        # blinks saturate the eye channels
+        while self.blink_start < self.sample + n:
+            eye[:, max(self.blink_start - self.sample, 0):max(self.blink_end - self.sample, 0)] = self.blink_level
+            if self.blink_end > self.sample + n:
+                break
+            self.schedule_blink(self.blink_end)
+        out[self.rows[0]] = eye[0]
+        out[self.rows[1]] = eye[1]
+
+        TR_samples = int(round(self.TR * self.sampling_rate))
+        phase = samples % TR_samples
+        out[self.rows[2]] = np.where(phase < int(self.trigger_duration * self.sampling_rate),
+                                     self.trigger_low, self.trigger_high)
+
+    def read(self, out):
+        n = out.shape[1]
+        if self.speed:
+            due = self.start_time + (self.sample + n) / self.sampling_rate / self.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        if self.raw:
+            self.generate(self.volts)
+            np.copyto(out, np.clip(self.volts / self.raw_scale[1], -32768, 32767), casting='unsafe')
+        else:
+            self.generate(out)
+        self.sample += n
+
+    def prepare_reward(self, interface, trace):
+        self.reward_logger = interface.logger
+        self.reward_seconds = len(trace) / interface.sampling_rate
+
+    def reward(self):
+        started = time.perf_counter()
+        self.rewards.append(self.sample)
+        self.reward_logger.debug("Simulated reward at sample {}".format(self.sample))
+        if self.speed:
+            time.sleep(self.reward_seconds / self.speed)
+        return started
@@ -0,0 +1,32 @@
+"""Timing of the steps between importing mreye and acquiring the first sample.
+
+Steps record how long they took with `timed` or `record`, and `report`
+summarises them for the session log. Steps that run in another process,
+such as a `DisplayProcess` opening its windows, are logged there instead.
+"""
+from mreye import IMPORT_START
+
+from contextlib import contextmanager
+import time
+
+# seconds taken by each step, in the order the steps finished
+timings = {}
+
+def record(name, seconds):
+    """Add `seconds` to the time taken by step `name`."""
+    timings[name] = timings.get(name, 0) + seconds
+
+@contextmanager
+def timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+def since_import():
+    """Seconds since mreye was first imported."""
+    return time.perf_counter() - IMPORT_START
+
+def report():
+    return ", ".join("{} {:.1f} ms".format(name, seconds * 1e3) for name, seconds in timings.items())
@@ -1,10 +1,28 @@
 from mreye.interface import Interface
 from mreye.getLogger import getLogger
 
-def test_reward():
-    interface = Interface('test.bin', getLogger())
-    interface.good_monkey()
-    interface.stop()
+from pathlib import Path
+import tempfile
+
+def test_reward(backend=None):
+    """Deliver one reward through the DAQ.
+
+    The reward is only sent while acquisition runs, so this also records
+    analog data; it is written to a temporary directory that is removed
+    afterwards.
+    """
+    logger = getLogger(name='reward', printLevel='DEBUG')
+    with tempfile.TemporaryDirectory() as tmp:
+        interface = Interface(Path(tmp)/'test.bin', logger, backend=backend)
+        interface.start()
+        interface.good_monkey(blocking=True)
+        interface.stop()
 
 if __name__ == '__main__':
-    test_reward()
+    import sys
+
+    if '--simulate' in sys.argv:
+        from mreye.simulation import SimulatedBackend
+        test_reward(SimulatedBackend())
+    else:
+        test_reward()
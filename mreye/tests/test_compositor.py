@@ -0,0 +1,72 @@
+from mreye.compositor import Compositor, draw_static
+
+import numpy as np
+import pytest
+
+pytest.importorskip('cv2')
+
+WIDTH, HEIGHT = 160, 120
+
+def video(rng, x, y, z, w=40, h=30):
+    return {'type': 'video', 'x': x, 'y': y, 'z': z, 'frame': rng.integers(1, 256, (h, w, 3), dtype=np.uint8)}
+
+def circle(x, y, r, c, z):
+    return {'type': 'circle', 'x': x, 'y': y, 'r': r, 'c': c, 'z': z}
+
+def reference(objects):
+    """Draw every object from scratch, lowest z first."""
+    frame = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    for obj in sorted(objects, key=lambda obj: obj['z']):
+        if obj['type'] == 'circle':
+            draw_static(frame, obj)
+            continue
+        h, w = obj['frame'].shape[:2]
+        x0, y0 = max(obj['x'], 0), max(obj['y'], 0)
+        x1, y1 = min(obj['x'] + w, WIDTH), min(obj['y'] + h, HEIGHT)
+        if x1 > x0 and y1 > y0:
+            frame[y0:y1, x0:x1] = obj['frame'][y0-obj['y']:y1-obj['y'], x0-obj['x']:x1-obj['x']]
+    return frame
+
+@pytest.fixture
+def scene():
+    rng = np.random.default_rng(0)
+    objects = [
+        circle(50, 40, 20, (0, 0, 255), 0),
+        video(rng, 30, 20, 1),
+        circle(60, 45, 10, (0, 255, 0), 2),
+        circle(70, 50, 15, (255, 0, 0), 2),
+        # partly off screen
+        video(rng, -10, 100, 3),
+        video(rng, 140, -5, 1),
+    ]
+    compositor = Compositor(WIDTH, HEIGHT)
+    for obj in objects:
+        compositor.add(obj)
+    return rng, compositor, objects
+
+def test_full_compose_matches_reference(scene):
+    _, compositor, objects = scene
+    assert (compositor.compose() == reference(objects)).all()
+
+def test_changed_videos_are_recomposited(scene):
+    rng, compositor, objects = scene
+    compositor.compose()
+    videos = [obj for obj in objects if obj['type'] == 'video']
+    for step in range(5):
+        changed = videos[step % len(videos):][:2]
+        for obj in changed:
+            obj['frame'] = rng.integers(1, 256, obj['frame'].shape, dtype=np.uint8)
+        assert (compositor.compose(changed) == reference(objects)).all()
+
+def test_display_list_changes_redraw(scene):
+    rng, compositor, objects = scene
+    compositor.compose()
+    compositor.remove(objects[2])
+    objects.remove(objects[2])
+    assert (compositor.compose() == reference(objects)).all()
+    obj = circle(20, 20, 12, (255, 255, 0), 1)
+    compositor.add(obj)
+    objects.append(obj)
+    assert (compositor.compose() == reference(objects)).all()
+    compositor.clear()
+    assert not compositor.compose().any()
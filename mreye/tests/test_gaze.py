@@ -0,0 +1,42 @@
+from mreye.gaze import GazeProcessor
+
+import numpy as np
+import pytest
+
+CALIBRATION = {'gain': {'x': 10, 'y': 10}, 'offset': {'x': 0, 'y': 0}}
+# eye tracker noise, in volts
+NOISE = 0.02
+
+def process(eye_h, eye_v, sampling_rate, chunk_size=None):
+    processor = GazeProcessor(sampling_rate, CALIBRATION)
+    if chunk_size is None:
+        return processor.process(eye_h, eye_v).saccade
+    return np.concatenate([
+        processor.process(eye_h[start:start+chunk_size], eye_v[start:start+chunk_size]).saccade
+        for start in range(0, len(eye_h), chunk_size)
+    ])
+
+@pytest.mark.parametrize('sampling_rate', [1000, 2000, 10000])
+def test_fixation_noise_is_not_a_saccade(sampling_rate):
+    rng = np.random.default_rng(0)
+    n = sampling_rate * 10
+    saccade = process(rng.normal(0, NOISE, n), rng.normal(0, NOISE, n), sampling_rate)
+    assert saccade.mean() < 0.001
+
+@pytest.mark.parametrize('sampling_rate', [1000, 2000, 10000])
+def test_saccade_detected(sampling_rate):
+    rng = np.random.default_rng(0)
+    t = np.arange(sampling_rate) / sampling_rate
+    # 10 degrees in 40 ms, starting at 0.5 s
+    eye_h = np.clip((t - 0.5) / 0.04, 0, 1) + rng.normal(0, NOISE, sampling_rate)
+    eye_v = rng.normal(0, NOISE, sampling_rate)
+    flagged = t[process(eye_h, eye_v, sampling_rate)]
+    assert len(flagged)
+    assert 0.5 <= flagged.min() and flagged.max() <= 0.6
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 333])
+def test_chunk_size_invariance(chunk_size):
+    rng = np.random.default_rng(1)
+    eye_h = np.cumsum(rng.normal(0, 0.01, 3000))
+    eye_v = np.cumsum(rng.normal(0, 0.01, 3000))
+    assert (process(eye_h, eye_v, 2000, chunk_size) == process(eye_h, eye_v, 2000)).all()
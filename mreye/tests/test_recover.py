@@ -0,0 +1,87 @@
+from mreye.benchmark import benchmark_sequence
+from mreye.events import read_events
+from mreye.fileformat import read_header
+from mreye.main import Experiment
+from mreye.recover import recover_session
+from mreye.render_backend import parse_hash_line
+from mreye.replay import Replay
+from mreye.session import Session
+from mreye.simulation import SimulatedBackend
+
+import os
+
+import numpy as np
+import pytest
+
+TR = 0.2
+
+def run(path, sequence=None, resume=False, seed=0):
+    backend = SimulatedBackend(TR=TR, speed=None, seed=seed, blink_rate=0)
+    experiment = Experiment(sequence, path, backend=backend, headless=True, resume=resume)
+    experiment.run()
+    return experiment
+
+def crash(path, block):
+    """Cut the data of a finished session in the middle of `block`, leaving a torn chunk."""
+    session = Session(path)
+    header = read_header(session.analog_data_path)
+    start = session.blocks[block]['start']
+    stop = start + int(1.5 * TR * session.sampling_rate)
+    chunk_size = header['chunk_size']
+    sample_nbytes = len(header['channels']) * np.dtype(header['dtype']).itemsize
+    # the events and index of the finished session now run past the data, as after a crash
+    os.truncate(session.analog_data_path, header['data_offset'] + (stop // chunk_size * chunk_size + chunk_size // 2) * sample_nbytes)
+    hashes = path/'frame_hashes.txt'
+    os.truncate(hashes, os.path.getsize(hashes) - 10)
+    return stop // chunk_size * chunk_size
+
+def signature(records):
+    return [(record['name'], record.get('sample')) for record in records if record['name'] != 'EXPERIMENT_START']
+
+@pytest.fixture
+def interrupted(tmp_path):
+    path = tmp_path/'session'
+    run(path, benchmark_sequence(3, 3))
+    samples = crash(path, 1)
+    return path, samples
+
+def test_recover_cuts_files_to_the_data(interrupted):
+    path, samples = interrupted
+    summary = recover_session(path)
+    assert summary['samples'] == samples
+    assert summary['data_bytes_removed'] > 0
+    assert summary['events_dropped'] > 0
+    session = Session(path)
+    assert session.n_samples == samples
+    assert all(event.sample is None or event.sample < samples for event in session.events)
+    assert session.index['sample'].max() <= samples
+    assert session.checkpoint['block'] == 1
+    # recovering again changes nothing
+    assert recover_session(path) == dict(summary, data_bytes_removed=0, event_bytes_removed=0, events_dropped=0,
+                                         index_entries_dropped=0, frame_hash_bytes_removed=0)
+
+def test_resume_reruns_the_interrupted_block(interrupted):
+    path, samples = interrupted
+    timing = np.load(path/'frame_timing.npy')
+    run(path, resume=True, seed=1)
+    # the first run's frame timing and hashes are kept, and frames are numbered on
+    assert (np.load(path/'frame_timing.npy') == timing).all()
+    assert len(np.load(path/'frame_timing_run2.npy'))
+    with open(path/'frame_hashes.txt') as f:
+        frames = [parse_hash_line(line)[0] for line in f]
+    assert frames == list(range(len(frames)))
+    session = Session(path)
+    assert [block['index'] for block in session.blocks] == [0, 1, 1, 2]
+    assert session.blocks[2]['start'] == samples
+    assert session.get_events('RESUME')[0].sample == samples
+    assert session.checkpoint['block'] == 3
+    replay = Replay(path)
+    replay.run()
+    assert signature(replay.events) == signature(read_events(session.events_path))
+
+def test_finished_session_is_not_resumed(tmp_path):
+    path = tmp_path/'session'
+    run(path, benchmark_sequence(2, 2))
+    assert Session(path).checkpoint['block'] == 2
+    with pytest.raises(ValueError, match="no blocks left"):
+        Experiment(None, path, backend=SimulatedBackend(), headless=True, resume=True)
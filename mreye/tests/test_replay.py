@@ -0,0 +1,37 @@
+from mreye.calibration import calibration_block
+from mreye.events import read_events
+from mreye.main import Experiment
+from mreye.replay import Replay
+from mreye.simulation import SimulatedBackend
+
+import pytest
+
+TR = 0.2
+
+def sequence():
+    return [
+        {'name': 'pre', 'n_triggers': 2},
+        calibration_block(target_duration=0.1, settle=0.05),
+        {'name': 'post', 'n_triggers': 3, 'fixation': {'x': 0, 'y': 0, 'radius': 3, 'proportion': 0.5}},
+    ]
+
+def signature(records):
+    return [(record['name'], record.get('sample'), record['args']) for record in records
+            if record['name'] != 'EXPERIMENT_START']
+
+@pytest.fixture(scope='module')
+def session(tmp_path_factory):
+    path = tmp_path_factory.mktemp('replay')/'session'
+    backend = SimulatedBackend(TR=TR, speed=None, seed=0)
+    Experiment(sequence(), path, backend=backend, headless=True).run()
+    return path
+
+# the calibration block starts in the middle of the larger chunks
+@pytest.mark.parametrize('read_chunk_size', [37, 50, 2000, 40000])
+def test_replay_matches_live_run(session, read_chunk_size):
+    recorded = signature(read_events(session/'events.jsonl'))
+    assert any(name == 'CALIBRATION_TARGET' for name, _, _ in recorded)
+    replay = Replay(session, read_chunk_size=read_chunk_size)
+    replay.run()
+    assert not replay.running
+    assert signature(replay.events) == recorded
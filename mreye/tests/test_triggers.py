@@ -0,0 +1,48 @@
+from mreye.triggers import EdgeDetector
+
+import numpy as np
+import pytest
+
+def trigger_signal(rng, n=5000):
+    """A trigger held at 5 V that drops to 0 V every 400 samples for 20, with noise and glitches."""
+    signal = np.full(n, 5.0)
+    for start in range(100, n, 400):
+        signal[start:start+20] = 0.0
+    signal += rng.normal(0, 0.2, n)
+    # single sample glitches and samples inside the hysteresis band
+    signal[rng.choice(n, 20, replace=False)] = 0.0
+    signal[rng.choice(n, 50, replace=False)] = 2.0
+    return signal
+
+def detect(signal, chunk_size):
+    detector = EdgeDetector(1.5, 2.5, debounce=3)
+    samples, rising = [], []
+    for start in range(0, len(signal), chunk_size):
+        s, r = detector.process(signal[start:start+chunk_size], start)
+        samples.append(s)
+        rising.append(r)
+    return np.concatenate(samples), np.concatenate(rising)
+
+def test_edges_found_at_their_sample():
+    signal = np.full(1000, 5.0)
+    signal[100:120] = 0.0
+    signal[500:520] = 0.0
+    samples, rising = detect(signal, 1000)
+    assert samples.tolist() == [100, 120, 500, 520]
+    assert rising.tolist() == [False, True, False, True]
+
+def test_glitches_are_ignored():
+    signal = np.full(1000, 5.0)
+    signal[300] = 0.0
+    signal[301] = 2.0
+    samples, _ = detect(signal, 1000)
+    assert len(samples) == 0
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 19, 50, 64, 333])
+def test_edges_do_not_depend_on_chunk_size(chunk_size):
+    signal = trigger_signal(np.random.default_rng(0))
+    expected_samples, expected_rising = detect(signal, len(signal))
+    assert len(expected_samples) == 2 * 13
+    samples, rising = detect(signal, chunk_size)
+    np.testing.assert_array_equal(samples, expected_samples)
+    np.testing.assert_array_equal(rising, expected_rising)
@@ -0,0 +1,75 @@
+import numpy as np
+
+class EdgeDetector:
+    """Finds the sample index of every edge of a trigger signal.
+
+    The signal is thresholded with hysteresis: it goes high above `high` and low
+    below `low`, and samples in between keep the previous state. An edge is only
+    reported once the new state has been held for `debounce` samples, so shorter
+    glitches are ignored. All state is carried across chunks, so edges that
+    straddle chunk boundaries are found at their exact sample.
+
+    Parameters
+    ----------
+    low: float
+        Threshold below which the signal is low
+    high: float
+        Threshold above which the signal is high
+    debounce: int, optional, default: 0
+        Minimum number of samples a new state must be held
+    initial_state: bool, optional, default: True
+        State assumed before the first sample
+    """
+    def __init__(self, low, high, debounce=0, initial_state=True):
+        if low > high:
+            raise ValueError("low threshold ({}) must not exceed high threshold ({})".format(low, high))
+        self.low = low
+        self.high = high
+        self.debounce = debounce
+        self.state = initial_state
+        self.raw_state = initial_state
+        self.pending = None
+
+    def process(self, signal, start_sample):
+        """Find the edges confirmed by the chunk `signal`, whose first sample is `start_sample`.
+
+        Returns
+        -------
+        samples: np.ndarray of int
+            Absolute sample index of each edge
+        rising: np.ndarray of bool
+            True for rising edges, False for falling edges
+        """
+        n = len(signal)
+        level = np.full(n, -1, dtype=np.int8)
+        level[signal > self.high] = 1
+        level[signal < self.low] = 0
+        # carry the last decided level over the samples in the hysteresis band
+        last = np.where(level >= 0, np.arange(n), -1)
+        np.maximum.accumulate(last, out=last)
+        state = np.where(last >= 0, level[last], self.raw_state).astype(bool)
+        changes = np.flatnonzero(state != np.concatenate(([self.raw_state], state[:-1])))
+        if n:
+            self.raw_state = bool(state[-1])
+
+        samples = []
+        rising = []
+        for local in changes:
+            sample = start_sample + int(local)
+            if self.pending is not None:
+                if sample - self.pending < self.debounce:
+                    # the pending edge was a glitch
+                    self.pending = None
+                    continue
+                self.state = not self.state
+                samples.append(self.pending)
+                rising.append(self.state)
+                self.pending = None
+            if bool(state[local]) != self.state:
+                self.pending = sample
+        if self.pending is not None and start_sample + n - self.pending >= self.debounce:
+            self.state = not self.state
+            samples.append(self.pending)
+            rising.append(self.state)
+            self.pending = None
+        return np.array(samples, dtype=np.int64), np.array(rising, dtype=bool)
@@ -0,0 +1,91 @@
+import queue
+import threading
+
+_END = None
+
+class VideoSource:
+    """Decodes a video file on a background thread, ahead of playback.
+
+    The file is opened and decoding starts as soon as the source is created;
+    up to `prefetch` decoded frames are held in a bounded queue, so the render
+    thread only has to take ready frames.
+
+    Parameters
+    ----------
+    path: str
+        Video file
+    prefetch: int, optional, default: 30
+        Number of decoded frames kept ahead of playback
+    loop: bool, optional, default: True
+        Restart from the first frame at the end of the file
+    """
+    prefetch = 30
+
+    def __init__(self, path, prefetch=None, loop=True):
+        self.path = path
+        if prefetch is not None:
+            self.prefetch = prefetch
+        self.loop = loop
+        self.frames = queue.Queue(maxsize=self.prefetch)
+        self.opened = threading.Event()
+        self.error = None
+        self.running = True
+        self.thread = threading.Thread(target=self.decode, name="video", daemon=True)
+        self.thread.start()
+
+    def decode(self):
+        import cv2
+        cap = cv2.VideoCapture(self.path)
+        try:
+            if not cap.isOpened():
+                raise IOError("Could not open video: {}".format(self.path))
+            self.fps = cap.get(cv2.CAP_PROP_FPS)
+            if not self.fps > 0:
+                raise IOError("Video has no frame rate: {}".format(self.path))
+            self.width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            self.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        except Exception as e:
+            self.error = e
+            cap.release()
+            self.opened.set()
+            return
+        self.opened.set()
+
+        while self.running:
+            ret, frame = cap.read()
+            if not ret:
+                if self.loop and cap.set(cv2.CAP_PROP_POS_FRAMES, 0):
+                    ret, frame = cap.read()
+                if not ret:
+                    self.put(_END)
+                    break
+            self.put(frame)
+        cap.release()
+
+    def put(self, frame):
+        while self.running:
+            try:
+                self.frames.put(frame, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def wait_opened(self, timeout=None):
+        """Block until the file is open, raising if it could not be opened."""
+        self.opened.wait(timeout)
+        if self.error is not None:
+            raise self.error
+
+    def next_frame(self, skip=0):
+        """Return the next decoded frame, after discarding `skip` frames.
+
+        Raises queue.Empty if the decoder has not caught up, returns None at the
+        end of a non-looping video.
+        """
+        for _ in range(skip):
+            if self.frames.get_nowait() is _END:
+                return _END
+        return self.frames.get_nowait()
+
+    def close(self):
+        self.running = False
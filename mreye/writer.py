@@ -0,0 +1,185 @@
+from mreye.fileformat import INDEX_DTYPE, index_path
+from mreye.getLogger import getLogger
+
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+_SYNC = object()
+_STOP = object()
+
+class ChunkWriter:
+    """Writes acquisition chunks to disk from a dedicated thread.
+
+    Chunks are copied into buffers taken from a preallocated pool and handed to
+    a writer thread, which coalesces them into large sequential writes. The
+    acquisition thread therefore never touches the file system. Index entries
+    queued with `mark` are appended to the sparse index next to the file.
+
+    Parameters
+    ----------
+    path: str or Path
+        File the chunks are appended to
+    chunk_shape: tuple
+        Shape of a single chunk as passed to `write`
+    dtype: numpy dtype, optional, default: np.float64
+        Data type of the stored samples
+    logger: logging.Logger, optional
+        Logger used to report back-pressure
+    pool_size: int, optional
+        Number of preallocated chunk buffers
+    flush_size: int, optional
+        Number of bytes accumulated before issuing a write
+    flush_interval: float, optional
+        Maximum number of seconds data is held before issuing a write
+    """
+    pool_size = 256
+    flush_size = 1 << 20
+    flush_interval = 1.0
+
+    def __init__(self, path, chunk_shape, dtype=np.float64, logger=None,
+                 pool_size=None, flush_size=None, flush_interval=None):
+        if logger is None:
+            logger = getLogger('writer')
+        self.logger = logger
+        self.path = Path(path)
+        self.chunk_shape = tuple(chunk_shape)
+        self.dtype = np.dtype(dtype)
+        if pool_size is not None:
+            self.pool_size = pool_size
+        if flush_size is not None:
+            self.flush_size = flush_size
+        if flush_interval is not None:
+            self.flush_interval = flush_interval
+
+        self.pool = [np.empty(self.chunk_shape, dtype=self.dtype) for _ in range(self.pool_size)]
+        self._pool_ids = {id(buf) for buf in self.pool}
+        self.free = queue.SimpleQueue()
+        for buf in self.pool:
+            self.free.put(buf)
+        self.pending = queue.Queue()
+
+        chunk_nbytes = self.pool[0].nbytes
+        self.staging = np.empty(max(self.flush_size // chunk_nbytes, 1) * chunk_nbytes, dtype=np.uint8)
+        self.staged = 0
+
+        self.bytes_written = 0
+        self.flushes = 0
+        self.syncs = 0
+        self.overruns = 0
+        self.max_queue_depth = 0
+        self.thread = None
+
+    @property
+    def queue_depth(self):
+        return self.pending.qsize()
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'overruns': self.overruns,
+            'bytes_written': self.bytes_written,
+            'flushes': self.flushes,
+            'syncs': self.syncs,
+        }
+
+    def start(self, header=None):
+        """Open the file and start the writer thread.
+
+        `header` is written first if the file is empty.
+        """
+        self.file = open(self.path, 'ab', buffering=0)
+        if header is not None and self.file.tell() == 0:
+            self.file.write(header)
+        self.index_file = open(index_path(self.path), 'ab')
+        self.thread = threading.Thread(target=self.run, name="writer", daemon=True)
+        self.thread.start()
+
+    def write(self, chunk):
+        """Queue a copy of `chunk` for writing. Never blocks on I/O."""
+        try:
+            buf = self.free.get_nowait()
+        except queue.Empty:
+            # pool exhausted: the disk is not keeping up
+            self.overruns += 1
+            if self.overruns == 1 or self.overruns % 100 == 0:
+                self.logger.warning("Writer pool exhausted ({} overruns, {} chunks queued)".format(
+                    self.overruns, self.queue_depth))
+            buf = np.empty(self.chunk_shape, dtype=self.dtype)
+        np.copyto(buf, chunk, casting='unsafe')
+        self.pending.put(buf)
+        depth = self.pending.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    def mark(self, sample, host_time):
+        """Queue an index entry mapping `sample` to wall clock `host_time`."""
+        self.pending.put((sample, host_time))
+
+    def sync(self):
+        """Flush everything queued so far and fsync the file."""
+        self.pending.put(_SYNC)
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.pending.put(_STOP)
+        self.thread.join()
+        self.thread = None
+        self.logger.info("Writer stopped: {}".format(self.stats()))
+
+    def flush(self):
+        if self.staged:
+            self.file.write(memoryview(self.staging)[:self.staged])
+            self.bytes_written += self.staged
+            self.staged = 0
+            self.flushes += 1
+        self.last_flush_time = time.monotonic()
+
+    def fsync(self):
+        self.index_file.flush()
+        os.fsync(self.index_file.fileno())
+        os.fsync(self.file.fileno())
+
+    def run(self):
+        self.last_flush_time = time.monotonic()
+        while True:
+            timeout = max(self.last_flush_time + self.flush_interval - time.monotonic(), 0)
+            try:
+                item = self.pending.get(timeout=timeout)
+            except queue.Empty:
+                self.flush()
+                continue
+            if item is _STOP:
+                self.flush()
+                self.fsync()
+                self.file.close()
+                self.index_file.close()
+                break
+            elif item is _SYNC:
+                self.flush()
+                self.fsync()
+                self.syncs += 1
+                continue
+            elif isinstance(item, tuple):
+                self.index_file.write(np.array(item, dtype=INDEX_DTYPE).tobytes())
+                continue
+
+            data = item.reshape(-1).view(np.uint8)
+            if self.staged + data.size > self.staging.size:
+                self.flush()
+            if data.size > self.staging.size:
+                self.file.write(data)
+                self.bytes_written += data.size
+            else:
+                self.staging[self.staged:self.staged+data.size] = data
+                self.staged += data.size
+            if id(item) in self._pool_ids:
+                self.free.put(item)
+            if time.monotonic() - self.last_flush_time >= self.flush_interval:
+                self.flush()